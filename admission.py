@@ -0,0 +1,394 @@
+"""
+Pre-parse cost estimates and admission control for symbolic work.
+
+Every equation and solution is sized up with the parser's own tokenizer
+before SymPy sees it: its length, the number of tokens, the deepest nesting
+of parentheses, the largest numeric exponent, the highest derivative order
+and the number of function calls. Tokenizing is linear in the input and
+never builds an expression, so even 9^9^9^9 is sized up in microseconds;
+input over MAX_INPUT_LENGTH is rejected before it is even tokenized.
+
+Input beyond a hard ceiling is rejected with CostExceeded (HTTP 413 for the
+length, 422 for everything else). Admitted work runs in one of two sandbox
+pools, picked by the estimated cost:
+
+- the fast lane, a pool of SANDBOX_WORKERS, for inputs costing up to
+  FAST_LANE_COST, such as every ordinary linearity check
+- the slow lane, a separate pool of SLOW_LANE_WORKERS, for the rest
+
+Each lane only waits for its own workers, so a cheap check never queues
+behind an expensive verification.
+"""
+import math
+import os
+import threading
+from collections import namedtuple
+
+from ode_parser import CONSTANTS, FUNCTIONS, PRIMES, ParseError, tokenize
+from ode_system import ODE_CACHE
+from parse_cache import PARSE_CACHE, merge_stats
+from sandbox import SANDBOX_WORKERS, SandboxPool
+from verification import DERIVATIVE_CACHE
+
+# Hard ceilings, checked for every input on its own
+MAX_INPUT_LENGTH = int(os.environ.get('MAX_INPUT_LENGTH', 2000))
+MAX_NESTING = int(os.environ.get('MAX_NESTING', 40))
+MAX_EXPONENT = float(os.environ.get('MAX_EXPONENT', 10000))
+MAX_DERIVATIVE_ORDER = int(os.environ.get('MAX_DERIVATIVE_ORDER', 50))
+MAX_FUNCTIONS = int(os.environ.get('MAX_FUNCTIONS', 100))
+
+# Requests costing more than this (see cost_score) run in the slow lane
+FAST_LANE_COST = float(os.environ.get('FAST_LANE_COST', 200))
+# No slow-lane workers either when the sandbox runs in the web process
+SLOW_LANE_WORKERS = int(os.environ.get('SLOW_LANE_WORKERS', 0 if SANDBOX_WORKERS <= 0 else max(1, SANDBOX_WORKERS // 2)))
+
+# Imported by the sandbox fork server, so new workers start warm
+WORKER_MODULES = ('linearity_checker', 'solution_verifier', 'grading', 'slope_field', 'phase_portrait',
+                  'ivp_solver', 'plot_data', 'plot_renderer')
+
+# exponent is the largest absolute numeric exponent (inf when it overflows)
+Cost = namedtuple('Cost', 'length tokens depth exponent order functions')
+
+
+def cost_score(cost):
+    """Rough units of symbolic work: tokens, weighted by what makes SymPy slow."""
+    return (cost.tokens + 5 * cost.depth + 10 * cost.functions + 20 * cost.order
+            + min(cost.exponent, MAX_EXPONENT))
+
+
+_METRIC_NAMES = {'depth': 'nesting depth', 'order': 'derivative order', 'functions': 'function count'}
+
+
+class CostExceeded(ValueError):
+    """
+    Input over a hard ceiling, rejected before it is parsed.
+
+    metric is the Cost field that is over its limit; status is the HTTP
+    status to answer with.
+    """
+
+    def __init__(self, metric, value, limit):
+        super().__init__(f"The input is too complex to analyze: its {_METRIC_NAMES.get(metric, metric)} "
+                         f"of {value:g} is over the limit of {limit:g}.")
+        self.metric = metric
+        self.value = value
+        self.limit = limit
+        self.message = str(self)
+        self.status = 413 if metric == 'length' else 422
+
+    def to_dict(self):
+        return {'code': 'cost_exceeded', 'metric': self.metric,
+                'value': self.value if math.isfinite(self.value) else None,
+                'limit': self.limit, 'message': self.message}
+
+
+_NUMERIC_OPS = ('+', '-', '*', '/', '(', ')')
+
+
+def _groups(tokens):
+    """
+    Match the parentheses in one pass. Returns, by the index of each '(',
+    the index just past its ')' (the END token when it is unclosed), the
+    largest absolute number inside, and whether it holds nothing but numbers
+    and arithmetic.
+    """
+    closing, largest, numeric = {}, {}, {}
+    # [index of '(', largest number so far, numbers only so far]
+    stack = []
+
+    def close(stop, closed):
+        i, big, numbers_only = stack.pop()
+        closing[i], largest[i], numeric[i] = stop, big, numbers_only and closed
+        if stack:
+            stack[-1][1] = max(stack[-1][1], big)
+            stack[-1][2] = stack[-1][2] and numeric[i]
+
+    for j, token in enumerate(tokens):
+        kind = token.kind
+        if kind == 'OP' and token.value == '(':
+            stack.append([j, 0.0, True])
+        elif kind == 'OP' and token.value == ')':
+            if stack:
+                close(j + 1, True)
+        elif stack:
+            if kind == 'NUMBER':
+                stack[-1][1] = max(stack[-1][1], abs(float(token.value)))
+            elif kind != 'POW' and token.value not in _NUMERIC_OPS:
+                stack[-1][2] = False
+    # Unclosed groups run to the END token; they are never evaluated
+    while stack:
+        close(len(tokens) - 1, False)
+    return closing, largest, numeric
+
+
+def _power(base, exponent):
+    try:
+        return math.pow(abs(base), exponent)
+    except OverflowError:
+        return math.inf
+    except ValueError:
+        return math.nan
+
+
+class _Numeric:
+    """
+    Float evaluation of the numbers-only tokens inside a pair of parentheses,
+    such as (10^5), overflowing to inf instead of building huge integers.
+    Inner groups and the exponents of powers were evaluated before (see
+    _operands) and are looked up rather than walked again.
+    """
+
+    def __init__(self, tokens, start, stop, closing, group_values, ends, values):
+        self.tokens = tokens
+        self.index = start
+        self.stop = stop
+        self.closing = closing
+        self.group_values = group_values
+        self.ends = ends
+        self.values = values
+
+    def _peek_op(self, values):
+        if self.index >= self.stop:
+            return None
+        token = self.tokens[self.index]
+        return token.value if token.kind == 'OP' and token.value in values else None
+
+    def expr(self):
+        value = self.term()
+        while (op := self._peek_op(('+', '-'))) is not None:
+            self.index += 1
+            value = value + self.term() if op == '+' else value - self.term()
+        return value
+
+    def term(self):
+        value = self.unary()
+        while (op := self._peek_op(('*', '/'))) is not None:
+            self.index += 1
+            operand = self.unary()
+            value = value * operand if op == '*' else (value / operand if operand else math.inf)
+        return value
+
+    def unary(self):
+        sign = 1.0
+        while (op := self._peek_op(('+', '-'))) is not None:
+            self.index += 1
+            sign = -sign if op == '-' else sign
+        return sign * self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.index < self.stop and self.tokens[self.index].kind == 'POW':
+            # The exponent with its signs and any further powers
+            exponent = self.values[self.index + 1]
+            if exponent is None:
+                raise ValueError('not numeric')
+            self.index = self.ends[self.index + 1]
+            return _power(base, exponent)
+        return base
+
+    def primary(self):
+        if self.index >= self.stop:
+            raise ValueError('incomplete')
+        token = self.tokens[self.index]
+        if token.kind == 'NUMBER':
+            self.index += 1
+            return float(token.value)
+        if token.kind == 'OP' and token.value == '(':
+            value = self.group_values.get(self.index)
+            if value is None:
+                raise ValueError('not numeric')
+            self.index = self.closing[self.index]
+            return value
+        raise ValueError('not numeric')
+
+
+def _operands(tokens):
+    """
+    Size up the operand of a power starting at every token: signs, then a
+    primary, then any further '^ operand' (powers are right-associative).
+
+    Returns, by token index, the index just past the operand, the largest
+    absolute number in it and its value when it is numbers only (else None).
+    Operands are sized up from the right, each from the ones after it, so
+    a chain such as x^x^...^x costs linear time, not quadratic.
+    """
+    closing, group_largest, group_numeric = _groups(tokens)
+    group_values = {}
+    end = len(tokens) - 1
+    ends = list(range(len(tokens)))
+    largest = [0.0] * len(tokens)
+    values = [None] * len(tokens)
+    for i in range(end - 1, -1, -1):
+        token = tokens[i]
+        kind = token.kind
+        if kind == 'OP' and token.value in ('+', '-'):
+            ends[i], largest[i] = ends[i + 1], largest[i + 1]
+            value = values[i + 1]
+            values[i] = -value if value is not None and token.value == '-' else value
+            continue
+        if kind == 'OP' and token.value == '(':
+            stop, big, value = closing[i], group_largest[i], None
+            if group_numeric[i]:
+                value = _group_value(tokens, i, closing, group_values, ends, values)
+                if value is not None:
+                    group_values[i] = value
+        elif kind == 'NAME' and tokens[i + 1].kind == 'OP' and tokens[i + 1].value == '(':
+            stop, big, value = closing[i + 1], group_largest[i + 1], None
+        elif kind == 'NAME' and tokens[i + 1].kind == 'PRIMES':
+            stop, big, value = i + 2, 0.0, None
+        elif kind == 'NUMBER':
+            value = float(token.value)
+            stop, big = i + 1, abs(value)
+        elif kind in ('NAME', 'DERIV'):
+            stop, big, value = i + 1, 0.0, None
+        else:
+            # Malformed; the parser will say where
+            continue
+        if tokens[stop].kind == 'POW':
+            exponent = stop + 1
+            stop, big = ends[exponent], max(big, largest[exponent])
+            value = _power(value, values[exponent]) if value is not None and values[exponent] is not None else None
+        ends[i], largest[i], values[i] = stop, big, value
+    return ends, largest, values
+
+
+def _group_value(tokens, i, closing, group_values, ends, values):
+    """Value of the numbers-only group opening at tokens[i], or None."""
+    stop = closing[i] - 1
+    numeric = _Numeric(tokens, i + 1, stop, closing, group_values, ends, values)
+    try:
+        value = numeric.expr()
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value if numeric.index == stop else None
+
+
+def estimate_cost(text):
+    """
+    Return the Cost of one input, from its tokens alone. Input over
+    MAX_INPUT_LENGTH is not even tokenized, and input the tokenizer rejects
+    costs only its length: parsing it fails at once.
+    """
+    if len(text) > MAX_INPUT_LENGTH:
+        return Cost(len(text), 0, 0, 0.0, 0, 0)
+    try:
+        tokens = tokenize(text)
+    except ParseError:
+        return Cost(len(text), 0, 0, 0.0, 0, 0)
+
+    ends, largest, values = _operands(tokens)
+
+    depth = level = order = functions = 0
+    exponent = 0.0
+    for i, token in enumerate(tokens):
+        kind = token.kind
+        if kind == 'OP':
+            if token.value == '(':
+                level += 1
+                depth = max(depth, level)
+            elif token.value == ')':
+                level -= 1
+        elif kind == 'DERIV':
+            order = max(order, token.value)
+        elif kind == 'PRIMES':
+            order = max(order, sum(PRIMES[ch] for ch in token.value))
+        elif kind == 'NAME':
+            following = tokens[i + 1]
+            if (following.kind == 'OP' and following.value == '(' and token.value not in ('x', 'y')
+                    and (token.value in FUNCTIONS or token.value not in CONSTANTS)):
+                functions += 1
+        elif kind == 'POW' and ends[i + 1] > i + 1:
+            # The exponent's absolute value, or its largest number when it is symbolic
+            value = values[i + 1]
+            if value is None:
+                exponent = max(exponent, largest[i + 1])
+            else:
+                exponent = max(exponent, abs(value) if not math.isnan(value) else math.inf)
+    # The END token is not counted
+    return Cost(len(text), len(tokens) - 1, depth, exponent, order, functions)
+
+
+_CEILINGS = (
+    ('length', 'MAX_INPUT_LENGTH'),
+    ('depth', 'MAX_NESTING'),
+    ('exponent', 'MAX_EXPONENT'),
+    ('order', 'MAX_DERIVATIVE_ORDER'),
+    ('functions', 'MAX_FUNCTIONS'),
+)
+
+
+def check_cost(cost):
+    """Raise CostExceeded when cost is over any hard ceiling."""
+    for field, setting in _CEILINGS:
+        value, limit = getattr(cost, field), globals()[setting]
+        if value > limit:
+            raise CostExceeded(field, value, limit)
+
+
+class Admission:
+    """Admit inputs by estimated cost and route them to the fast or the slow lane."""
+
+    def __init__(self, fast, slow, fast_lane_cost=FAST_LANE_COST):
+        self.lanes = {'fast': fast, 'slow': slow}
+        self.fast_lane_cost = fast_lane_cost
+        self._lock = threading.Lock()
+        self.admitted = {'fast': 0, 'slow': 0}
+        self.rejected = 0
+
+    def admit(self, *texts):
+        """
+        Check every input against the hard ceilings and return the sandbox
+        pool for their combined cost. Raises CostExceeded.
+        """
+        score = 0.0
+        for text in texts:
+            cost = estimate_cost(text)
+            try:
+                check_cost(cost)
+            except CostExceeded:
+                with self._lock:
+                    self.rejected += 1
+                raise
+            score += cost_score(cost)
+
+        lane = 'fast' if score <= self.fast_lane_cost else 'slow'
+        with self._lock:
+            self.admitted[lane] += 1
+        return self.lanes[lane]
+
+    def start(self):
+        """Start the workers of both lanes."""
+        for pool in self.lanes.values():
+            pool.start()
+
+    def cache_stats(self):
+        """Return the caches of the workers of both lanes, by name."""
+        by_name = {}
+        for pool in self.lanes.values():
+            for name, stats in pool.cache_stats().items():
+                by_name.setdefault(name, []).append(stats)
+        return {name: merge_stats(stats) for name, stats in by_name.items()}
+
+    def stats(self):
+        return {
+            'fast_lane_cost': self.fast_lane_cost,
+            'admitted': dict(self.admitted),
+            'rejected': self.rejected,
+            'lanes': {name: pool.stats() for name, pool in self.lanes.items()},
+        }
+
+
+def worker_cache_stats():
+    """The caches filled inside a sandbox worker, sent back after every job."""
+    return {
+        'parse_cache': PARSE_CACHE.stats(),
+        'derivative_cache': DERIVATIVE_CACHE.stats(),
+        'ode_cache': ODE_CACHE.stats(),
+    }
+
+
+ADMISSION = Admission(
+    SandboxPool(report=worker_cache_stats, preload=WORKER_MODULES),
+    SandboxPool(workers=SLOW_LANE_WORKERS, report=worker_cache_stats, preload=WORKER_MODULES),
+)
+admit = ADMISSION.admit
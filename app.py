@@ -1,29 +1,37 @@
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
-# Conditionally import matplotlib only when needed
+from flask import Flask, render_template, request, jsonify, abort, Response
 import os
 import secrets
-import io
-import base64
-import re
+import json
 import logging
 from logging.handlers import RotatingFileHandler
-from sympy import symbols, diff, sympify, solve, Eq, Add, Function, sin, exp
-from sympy.parsing.sympy_parser import parse_expr
-from sympy.utilities.lambdify import lambdify
 import numpy as np
-import sys
 from dotenv import load_dotenv
 import datetime
 from logging_config import setup_logging, log_error, log_request
-
-# Import matplotlib early to ensure it's available
-try:
-    import matplotlib
-    matplotlib.use('Agg')  # Use non-interactive backend
-    import matplotlib.pyplot as plt
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
+from linearity_checker import stored_is_linear
+from linearity_batch import MAX_BATCH_SIZE, check_linearity_batch
+from verification import DEFAULT_POINTS, DERIVATIVE_CACHE, MAX_POINTS, MIN_VALID_POINTS
+from parse_cache import PARSE_CACHE, canonicalize, merge_stats
+from solution_verifier import verify_with_sympy
+from plot_store import DIGEST_RE, PLOT_RANGE, PLOT_STORE, PLOT_STYLE, plot_key
+from plot_data import (CURVE_CACHE, FAMILY_MEMBERS, MAX_FAMILY_MEMBERS, PlotError, curve_bytes, curve_metadata, curve_payload,
+                       family_payload, sample_family, sample_solution)
+from plot_renderer import MATPLOTLIB_AVAILABLE, PLACEHOLDER_URL, render_curve, render_error_plot, render_family, render_phase_portrait, render_slope_field
+from ode_system import ODE_CACHE, ExplicitFormError
+from ivp_solver import (DEFAULT_IVP_POINTS, MAX_IVP_POINTS, MAX_TRAJECTORIES, InitialConditionError, solve_equation,
+                        trajectories_payload)
+from phase_portrait import (MAX_PHASE_CELLS, MAX_PHASE_TRAJECTORIES, PHASE_GRID, PHASE_RANGE, TRAJECTORY_CACHE,
+                            default_starts, equation_phase_portrait, portrait_payload)
+from slope_field import MAX_SLOPE_CELLS, SLOPE_GRID, SLOPE_X_RANGE, SLOPE_Y_RANGE, equation_slope_field, field_payload
+from grading import MAX_CANDIDATES, grade_solutions
+from verdict_store import VERDICT_STORE
+from single_flight import SINGLE_FLIGHT
+from sandbox import BudgetExceeded
+from admission import ADMISSION, CostExceeded, admit
+from job_store import JOB_STORE
+
+# Plots are rendered with matplotlib's Figure API in plot_renderer.py
+if not MATPLOTLIB_AVAILABLE:
     print("WARNING: Matplotlib not available. Plotting functionality will be limited.")
 
 # Load environment variables
@@ -115,6 +123,9 @@ if LIMITER_AVAILABLE:
         strategy="fixed-window"
     )
 
+# Start the sandbox workers now, before any request thread exists
+ADMISSION.start()
+
 # Known cases removed as requested
 
 @app.route('/')
@@ -133,8 +144,20 @@ def check_linearity():
             'message': 'Please enter a differential equation.'
         })
     
-    # Check if the equation is linear
-    if is_linear_de(equation):
+    # Check if the equation is linear (or was, in any worker), within budget
+    # and in the lane for its cost
+    lane = admit(equation)
+    try:
+        is_linear = stored_is_linear(equation, lane.run)
+    except BudgetExceeded:
+        raise
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f"Error analyzing equation: {str(e)}"
+        })
+    
+    if is_linear:
         return jsonify({
             'status': 'success',
             'message': f"The differential equation '{equation}' is linear."
@@ -145,6 +168,31 @@ def check_linearity():
             'message': f"The differential equation '{equation}' is not linear."
         })
 
+@app.route('/check_linearity/batch', methods=['POST'])
+def check_linearity_batch_route():
+    """Check a JSON array of differential equations for linearity"""
+    data = request.get_json(silent=True)
+    equations = data.get('equations') if isinstance(data, dict) else data
+    
+    if not isinstance(equations, list) or not equations:
+        return jsonify({
+            'status': 'error',
+            'message': 'Please send a JSON array of differential equations.'
+        })
+    
+    if len(equations) > MAX_BATCH_SIZE:
+        return jsonify({
+            'status': 'error',
+            'message': f'At most {MAX_BATCH_SIZE} equations can be checked at once.'
+        })
+    
+    results = check_linearity_batch([str(equation) for equation in equations])
+    return jsonify({
+        'status': 'success',
+        'message': f"Checked {len(results)} equations: {sum(bool(r['is_linear']) for r in results)} linear.",
+        'results': results
+    })
+
 @app.route('/verify_solution', methods=['POST'])
 def verify_solution():
     """Verify if a function is a solution to a differential equation"""
@@ -158,269 +206,519 @@ def verify_solution():
             'message': 'Please enter both the differential equation and the proposed solution.'
         })
     
-    # Verify the solution
-    result = verify_simple_solution(de, solution)
-    
-    # Always generate a plot, even if the solution is not valid
-    plot_url = generate_solution_plot(de, solution)
-    
-    if result['is_valid']:
+    # Optional sampling domain and number of test points, and whether to
+    # plot the whole solution family
+    try:
+        domain, num_points = read_sampling_options(request.form)
+        members = read_family_option(request.form)
+    except ValueError as e:
         return jsonify({
-            'status': 'success',
-            'message': f"The function '{solution}' is a valid solution to the differential equation '{de}'.",
-            'plot_url': plot_url
+            'status': 'error',
+            'message': str(e)
         })
-    else:
+    
+    # Read everything the plot needs while the request is still here
+    data_format = request.form.get('format', '').strip().lower() == 'data'
+    render_errors = read_flag(request.form, 'render_errors')
+    
+    # Admitted once for the verdict and the plot, which both run in its lane.
+    # The cost is checked here, so over-complex input is rejected even in
+    # async mode.
+    lane = admit(de, solution)
+    
+    def verdict():
+        return verification_response(de, solution, verify_simple_solution(de, solution, domain, num_points, lane))
+    
+    # Always generate a plot, even if the solution is not valid; a solution
+    # that cannot be plotted gets a placeholder and a structured plot_error.
+    # With format=data the sampled curve is returned instead of an image.
+    def plot():
+        if data_format:
+            return generate_plot_data(solution, members, lane)
+        return generate_solution_plot(de, solution, render_errors, members, lane)
+    
+    # In async mode the verdict and the plot are computed in parallel in the
+    # background; the client polls the job or subscribes to its events.
+    if read_flag(request.form, 'async'):
+        job_id = JOB_STORE.submit({'verdict': lambda: budgeted(verdict), 'plot': plot})
         return jsonify({
+            'status': 'accepted',
+            'message': 'Verification started.',
+            'job_id': job_id,
+            'job_url': f"/jobs/{job_id}",
+            'events_url': f"/jobs/{job_id}/events"
+        }), 202
+    
+    response = verdict()
+    # Include the plot even for invalid solutions
+    response.update(plot())
+    return jsonify(response)
+
+def budgeted(compute):
+    """Return compute(), or the error fields of a response when it ran over its budget"""
+    try:
+        return compute()
+    except BudgetExceeded as e:
+        return {
             'status': 'error',
-            'message': f"The function '{solution}' is not a valid solution to the differential equation '{de}'. {result.get('reason', '')}",
-            'plot_url': plot_url  # Include plot URL even for invalid solutions
-        })
+            'message': e.message,
+            'budget_exceeded': e.to_dict()
+        }
 
-def normalize_equation(equation):
-    """Normalize the equation for analysis"""
-    # Clean up the equation
-    normalized = equation.strip()
-    
-    # Make sure there's a right-hand side
-    if "=" not in normalized:
-        normalized = f"{normalized} = 0"
-        
-    # Parse to standard form: F(x,y,y',y'',...) = 0
-    left_side, right_side = normalized.split("=", 1)
-    normalized = f"{left_side.strip()} - ({right_side.strip()}) = 0"
+def verification_response(de, solution, result):
+    """Return the status and message of a verification result"""
+    if result['is_valid']:
+        return {
+            'status': 'success',
+            'message': f"The function '{solution}' is a valid solution to the differential equation '{de}'."
+        }
+    return {
+        'status': 'error',
+        'message': f"The function '{solution}' is not a valid solution to the differential equation '{de}'. {result.get('reason', '')}"
+    }
+
+# State of an asynchronous verification
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = JOB_STORE.get(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Unknown or expired job.'
+        }), 404
     
-    print(f"Normalized equation: {normalized}")
-    return normalized
+    return jsonify(dict(job, status='success', job_id=job_id))
 
-def is_linear_de(equation):
-    """
-    Determine if a differential equation is linear using a hybrid approach.
-    
-    This function uses both pattern matching and SymPy symbolic analysis:
-    1. First performs fast pattern matching to identify obvious non-linear terms
-    2. Then applies rigorous symbolic mathematics using SymPy for more complex cases
-    
-    A differential equation is linear if it can be written in the form:
-    a₀(x)y + a₁(x)y' + a₂(x)y'' + ... + aₙ(x)y^(n) = f(x)
+# Server-sent events for an asynchronous verification: an event per part
+# (verdict, plot) as soon as it is ready, then done
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if JOB_STORE.get(job_id) is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Unknown or expired job.'
+        }), 404
     
-    Where all coefficients a₀(x), a₁(x), etc. are functions of x only (not involving y).
+    def stream():
+        for event, value in JOB_STORE.watch(job_id):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(value)}\n\n"
     
-    Key properties that make an equation NON-linear include:
-    1. Any term with y or its derivatives raised to a power other than 1
-    2. Products of y or its derivatives (like y*y' or y'*y'')
-    3. Transcendental functions of y (like sin(y), e^y, etc.)
-    4. Rational expressions with y in the denominator
-    """
-    print(f"\nAnalyzing equation: {equation}")
-    
-    # STEP 1: Clean and normalize the equation
-    # ----------------------------------------
-    # Replace unicode prime symbols with standard notation
-    equation = equation.replace('′', "'")
-    
-    # STEP 2: Direct pattern matching for obvious non-linear terms
-    # -----------------------------------------------------------
-    # This is faster and more reliable than symbolic parsing for clear cases
-    if _contains_nonlinear_patterns(equation):
-        return False
-        
-    # STEP 3: Make sure it's actually a differential equation
-    # -----------------------------------------------------
-    if "y'" not in equation and "y′" not in equation:
-        print("Not a differential equation: no derivatives found")
-        return False
-    
-    # STEP 4: Symbolic mathematical analysis (if pattern matching is inconclusive)
-    # ---------------------------------------------------------------------------
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep proxies such as nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# A client polls a job many times for one verification, so the job routes
+# get their own limit instead of the default one meant for computations
+if LIMITER_AVAILABLE:
+    job_limit = limiter.limit(os.environ.get('JOB_RATE_LIMIT', '120 per minute'))
+    for endpoint in ('job_status', 'job_events'):
+        app.view_functions[endpoint] = job_limit(app.view_functions[endpoint])
+
+@app.route('/grade', methods=['POST'])
+def grade():
+    """Verify many candidate solutions against one differential equation"""
+    # Accept a JSON body or form data with repeated 'solutions' fields
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        form = {key: str(value) for key, value in data.items() if key != 'solutions'}
+        solutions = data.get('solutions') or []
+    else:
+        form = request.form
+        solutions = request.form.getlist('solutions')
+
+    de = form.get('de', '')
+    solutions = [str(solution) for solution in solutions if str(solution).strip()]
+
+    if not de or not solutions:
+        return jsonify({
+            'status': 'error',
+            'message': 'Please enter the differential equation and at least one proposed solution.'
+        })
+
+    if len(solutions) > MAX_CANDIDATES:
+        return jsonify({
+            'status': 'error',
+            'message': f'At most {MAX_CANDIDATES} solutions can be graded at once.'
+        })
+
+    try:
+        domain, num_points = read_sampling_options(form)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+
+    lane = admit(de, *solutions)
     try:
-        if not _is_linear_symbolic_analysis(equation):
-            return False
+        results = lane.run(grade_solutions, de, solutions, domain, num_points)
+    except BudgetExceeded:
+        raise
     except Exception as e:
-        print(f"Symbolic analysis failed: {str(e)}")
-        # If symbolic analysis fails, we rely on the pattern matching already done
-    
-    # If we get here and no non-linearity was detected, the equation is linear
-    print("Equation is linear - all checks passed")
-    return True
+        print(f"Error in grading: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f"Could not parse the differential equation '{de}'."
+        })
 
+    # Plots are expensive, so they are only drawn on request
+    if read_flag(form, 'plots'):
+        render_errors = read_flag(form, 'render_errors')
+        for result in results:
+            result.update(generate_solution_plot(de, result['solution'], render_errors))
 
-def _contains_nonlinear_patterns(equation):
-    """
-    Check if the equation contains obvious non-linear terms using pattern matching.
+    for result in results:
+        result['domain'] = list(result['domain'])
+
+    return jsonify({
+        'status': 'success',
+        'message': f"Graded {len(results)} solutions: {sum(r['is_valid'] for r in results)} valid.",
+        'results': results
+    })
+
+@app.route('/slope_field', methods=['POST'])
+def slope_field_route():
+    """Draw the slope field of a first-order equation y' = f(x, y)"""
+    de = request.form.get('de', '')
+    if not de:
+        return jsonify({
+            'status': 'error',
+            'message': 'Please enter a first-order differential equation.'
+        })
     
-    This function uses fast string pattern matching (not SymPy) to quickly identify
-    common non-linear structures without the overhead of symbolic computation.
+    try:
+        x_range, y_range, nx, ny = read_field_options(request.form)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
     
-    The patterns are organized into groups:
-    - Basic terms involving y itself (powers, trig functions, etc.)
-    - Terms involving first derivatives (y')
-    - Terms involving second derivatives (y'')
-    - Terms involving third derivatives (y''')
+    lane = admit(de)
+    try:
+        constants, field = lane.run(equation_slope_field, de, x_range, y_range, nx, ny)
+    except BudgetExceeded:
+        raise
+    except ExplicitFormError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+    except Exception as e:
+        print(f"Error in slope field: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f"Could not parse the differential equation '{de}'."
+        })
     
-    Returns True if non-linear patterns are found.
-    """
-    # GROUP 1: Basic non-linear terms involving y itself
-    basic_nonlinear = [
-        "y**", "y^", "y*y",                # y raised to powers
-        "sin(y)", "cos(y)", "tan(y)",      # trigonometric functions of y
-        "exp(y)", "e^y", "e**y",           # exponential of y
-        "log(y)", "ln(y)",                 # logarithmic terms
-        "/y", "1/y",                       # rational expressions with y in denominator
-    ]
-    
-    # GROUP 2: Non-linear terms involving first derivative
-    first_derivative_nonlinear = [
-        "y'**", "y'^", "y'*y'",            # y' raised to powers
-        "sin(y')", "cos(y')", "tan(y')",   # trig functions of y'
-        "exp(y')", "e^y'", "e**y'",        # exponential of y'
-        "y*y'",                            # product of y and y'
-    ]
-    
-    # GROUP 3: Non-linear terms involving second derivative
-    second_derivative_nonlinear = [
-        "y''**", "y''^", "y''*y''",        # y'' raised to powers
-        "sin(y'')", "cos(y'')", "tan(y'')",# trig functions of y''
-        "exp(y'')", "e^y''", "e**y''",     # exponential of y''
-        "e^(y'')", "e**(y'')",             # alternative notation
-        "y*y''", "y'*y''",                 # products with y''
-    ]
-    
-    # GROUP 4: Non-linear terms involving third derivative
-    third_derivative_nonlinear = [
-        "y'''**", "y'''^", "y'''*y'''",    # y''' raised to powers
-        "sin(y''')", "e^y'''",             # functions of y'''
-        "y*y'''", "y'*y'''", "y''*y'''",   # products with y'''
-    ]
-    
-    # Combine all pattern groups
-    all_patterns = []
-    all_patterns.extend(basic_nonlinear)
-    all_patterns.extend(first_derivative_nonlinear)
-    all_patterns.extend(second_derivative_nonlinear)
-    all_patterns.extend(third_derivative_nonlinear)
-    
-    # Also check for patterns using unicode prime (′) instead of standard prime (')
-    unicode_patterns = [p.replace("'", "′") for p in all_patterns]
-    all_patterns.extend(unicode_patterns)
-    
-    # Check each pattern
-    for pattern in all_patterns:
-        if pattern in equation:
-            print(f"Non-linear term detected: {pattern}")
-            return True
-            
-    # No non-linear patterns found
-    return False
-
-
-def _is_linear_symbolic_analysis(equation):
-    """
-    Analyze the equation using SymPy's symbolic mathematics to determine linearity.
+    response = {
+        'status': 'success',
+        'message': f"Slope field of '{de}' on a {nx} x {ny} grid.",
+        'constants': constants
+    }
+    if request.form.get('format', '').strip().lower() == 'data':
+        response['field'] = field_payload(field)
+        return jsonify(response)
     
-    This function provides a rigorous mathematical analysis using SymPy library to:
-    1. Transform the equation into symbolic form
-    2. Examine coefficients of derivatives
-    3. Check for higher powers of dependent variable
-    4. Detect transcendental functions applied to dependent variable
+    if not MATPLOTLIB_AVAILABLE:
+        return jsonify({
+            'status': 'error',
+            'message': 'Plotting is not available on this server. Use format=data.'
+        })
+    digest = plot_key(PLOT_STYLE, 'slope', canonicalize(de), x_range, y_range, nx, ny)
+    try:
+        store_plot(digest, lambda: lane.run(render_slope_field, de, field))
+    except PlotError as e:
+        return jsonify({
+            'status': 'error',
+            'message': e.message,
+            'plot_error': e.to_dict()
+        })
+    response['plot_url'] = f"/plots/{digest}.png"
+    return jsonify(response)
+
+@app.route('/phase_portrait', methods=['POST'])
+def phase_portrait_route():
+    """Draw the phase portrait of an autonomous second-order equation y'' = f(y, y')"""
+    # Accept a JSON body or form data with repeated 'starts' fields such as
+    # "1, 0" (y, y')
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        form = {key: str(value) for key, value in data.items() if key != 'starts'}
+        starts = data.get('starts') or []
+    else:
+        form = request.form
+        starts = [value.split(',') for value in request.form.getlist('starts') if value.strip()]
     
-    Returns True if the equation is found to be linear.
-    """
-    from sympy import symbols, Function, diff, sin, exp
+    de = form.get('de', '')
+    if not de:
+        return jsonify({
+            'status': 'error',
+            'message': 'Please enter a second-order differential equation.'
+        })
     
-    # Create symbolic variables and function
-    x = symbols('x')
-    y = Function('y')(x)
+    try:
+        y_range = read_range(form, 'y_min', 'y_max', PHASE_RANGE)
+        v_range = read_range(form, 'v_min', 'v_max', PHASE_RANGE)
+        ny, nv = read_grid_size(form, ('ny', 'nv'), PHASE_GRID, MAX_PHASE_CELLS)
+        try:
+            starts = np.array([[float(value) for value in start] for start in starts], dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError('Each start must be a pair of numbers: y, y\'.')
+        if not starts.size:
+            # Fixed default starts, so panning and zooming reuse the trajectories
+            starts = default_starts(PHASE_RANGE, PHASE_RANGE)
+        if starts.ndim != 2 or starts.shape[1] != 2 or not np.isfinite(starts).all():
+            raise ValueError('Each start must be a pair of numbers: y, y\'.')
+        if len(starts) > MAX_PHASE_TRAJECTORIES:
+            raise ValueError(f'At most {MAX_PHASE_TRAJECTORIES} starts can be integrated at once.')
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
     
-    # Normalize the equation to standard form: expression = 0
-    if '=' in equation:
-        lhs, rhs = equation.split('=', 1)
-        eq_str = f"({lhs.strip()}) - ({rhs.strip()})"
+    lane = admit(de)
+    try:
+        constants, field, trajectories = equation_phase_portrait(
+            de, y_range, v_range, ny, nv, starts, run=lane.run
+        )
+    except BudgetExceeded:
+        raise
+    except ExplicitFormError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+    except Exception as e:
+        print(f"Error in phase portrait: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f"Could not parse the differential equation '{de}'."
+        })
+    
+    response = {
+        'status': 'success',
+        'message': f"Phase portrait of '{de}' with {len(starts)} trajectories.",
+        'constants': constants
+    }
+    if form.get('format', '').strip().lower() == 'data':
+        response['portrait'] = portrait_payload(field, trajectories)
+        return jsonify(response)
+    
+    if not MATPLOTLIB_AVAILABLE:
+        return jsonify({
+            'status': 'error',
+            'message': 'Plotting is not available on this server. Use format=data.'
+        })
+    digest = plot_key(PLOT_STYLE, 'phase', canonicalize(de), y_range, v_range, ny, nv, starts.tolist())
+    try:
+        store_plot(digest, lambda: lane.run(render_phase_portrait, de, field, trajectories))
+    except PlotError as e:
+        return jsonify({
+            'status': 'error',
+            'message': e.message,
+            'plot_error': e.to_dict()
+        })
+    response['plot_url'] = f"/plots/{digest}.png"
+    return jsonify(response)
+
+@app.route('/solve_ivp', methods=['POST'])
+def solve_ivp_route():
+    """Integrate an equation numerically for a batch of initial conditions"""
+    # Accept a JSON body or form data with repeated 'initial' fields such as
+    # "1, 0" (y(x0), y'(x0), ...)
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        form = {key: str(value) for key, value in data.items() if key != 'initial'}
+        initial = data.get('initial') or []
     else:
-        eq_str = equation.strip()
-        
-    # Step 1: Convert to SymPy syntax
-    # -------------------------------
-    # Replace derivatives with proper SymPy notation
-    eq_str = eq_str.replace("y'''", "Derivative(y(x), x, 3)")
-    eq_str = eq_str.replace("y''", "Derivative(y(x), x, 2)")
-    eq_str = eq_str.replace("y'", "Derivative(y(x), x)")
+        form = request.form
+        initial = [[part for part in value.split(',') if part.strip()]
+                   for value in request.form.getlist('initial') if value.strip()]
     
-    # Replace standalone y with y(x) function notation
-    eq_str = re.sub(r'(?<![a-zA-Z0-9_])y(?![a-zA-Z0-9_\(])', 'y(x)', eq_str)
+    de = form.get('de', '')
+    if not de or not initial:
+        return jsonify({
+            'status': 'error',
+            'message': 'Please enter the differential equation and at least one initial condition.'
+        })
     
-    # Replace power notation
-    eq_str = eq_str.replace('^', '**')
+    try:
+        x0, initial = read_initial_conditions(form, initial)
+        x_range = read_range(form, 'x_min', 'x_max', SLOPE_X_RANGE)
+        if not x_range[0] <= x0 <= x_range[1]:
+            raise ValueError('x0 must lie between x_min and x_max.')
+        points = form.get('points', '').strip()
+        if not points.isdigit() and points:
+            raise ValueError('points must be a whole number.')
+        points = int(points) if points else DEFAULT_IVP_POINTS
+        if not 2 <= points <= MAX_IVP_POINTS:
+            raise ValueError(f'points must be between 2 and {MAX_IVP_POINTS}.')
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
     
-    print(f"Symbolic form: {eq_str}")
+    lane = admit(de)
+    try:
+        order, constants, trajectories = lane.run(solve_equation, de, x0, initial, x_range, points)
+    except BudgetExceeded:
+        raise
+    except (ExplicitFormError, InitialConditionError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+    except Exception as e:
+        print(f"Error in IVP solver: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f"Could not parse the differential equation '{de}'."
+        })
     
-    # Step 2: Parse the equation into a symbolic expression
-    # ---------------------------------------------------
+    finished = sum(status == 'ok' for status in trajectories.status)
+    return jsonify({
+        'status': 'success',
+        'message': f"Integrated {len(initial)} initial conditions: {finished} over the whole interval.",
+        'order': order,
+        'constants': constants,
+        'x0': x0,
+        'result': trajectories_payload(trajectories)
+    })
+
+def read_initial_conditions(form, initial):
+    """
+    Read x0 (default 0) and the initial conditions: a number or a list of
+    numbers (y(x0), y'(x0), ...) per trajectory.
+    """
+    x0 = form.get('x0', '').strip()
     try:
-        expr = parse_expr(eq_str, local_dict={'y': y, 'x': x, 'Derivative': diff})
-        
-        # Step 3: Check linearity conditions
-        # ---------------------------------
-        
-        # Create a list of y and all its derivatives to check
-        derivatives = [y]  # y itself
-        for i in range(1, 4):  # Add first, second, and third derivatives
-            derivatives.append(diff(y, x, i))
-            
-        # Check 1: No variable coefficient for derivatives
-        # ----------------------------------------------
-        # For a linear DE, coefficients of derivatives must not contain y or its derivatives
-        for deriv in derivatives:
-            if expr.has(deriv):
-                try:
-                    # Collect terms with respect to this derivative
-                    collected = expr.collect(deriv)
-                    
-                    # Get the coefficient of the derivative
-                    coeff = collected.coeff(deriv)
-                    
-                    # Check if coefficient contains y or any derivative
-                    if any(str(d) in str(coeff) for d in derivatives):
-                        print(f"Non-linear: coefficient of {deriv} contains y or its derivatives")
-                        return False
-                except Exception as e:
-                    print(f"Error analyzing coefficients: {e}")
-                    # Be conservative - if we can't analyze, assume non-linear
-                    return False
-                    
-        # Check 2: No higher powers of derivatives
-        # --------------------------------------
-        for deriv in derivatives:
-            # Check for terms like (y')² or y'·y'
-            if expr.has(deriv**2) or expr.has(deriv*deriv):
-                print(f"Non-linear: found squared term {deriv}")
-                return False
-                
-        # Check 3: No transcendental functions applied to y or derivatives
-        # -------------------------------------------------------------
-        for func in [sin, exp]:  # Check common functions
-            for deriv in derivatives:
-                if expr.has(func(deriv)):
-                    print(f"Non-linear: found {func.__name__} of {deriv}")
-                    return False
-        
-        # Equation passed all symbolic checks for linearity
-        return True
+        x0 = float(x0) if x0 else 0.0
+        rows = [[float(value) for value in row] if isinstance(row, (list, tuple)) else [float(row)]
+                for row in initial]
+    except (TypeError, ValueError):
+        raise ValueError('x0 and the initial conditions must be numbers.')
+    if len(rows) > MAX_TRAJECTORIES:
+        raise ValueError(f'At most {MAX_TRAJECTORIES} initial conditions can be integrated at once.')
+    if not np.isfinite(x0) or not all(np.isfinite(row).all() for row in rows):
+        raise ValueError('x0 and the initial conditions must be finite.')
+    return x0, rows
+
+def read_flag(form, name):
+    """Read an optional true/false field of a request"""
+    return form.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def read_sampling_options(form):
+    """Read the optional x_min, x_max and points fields of a verification request"""
+    domain = read_range(form, 'x_min', 'x_max', None)
+    points = form.get('points', '').strip()
+    
+    num_points = None
+    if points:
+        try:
+            num_points = int(points)
+        except ValueError:
+            raise ValueError('points must be a whole number.')
+        if not MIN_VALID_POINTS <= num_points <= MAX_POINTS:
+            raise ValueError(f'points must be between {MIN_VALID_POINTS} and {MAX_POINTS}.')
+    
+    return domain, num_points
+
+def read_range(form, low_name, high_name, default):
+    """Read an optional pair of bounds, falling back to default when both are missing"""
+    low = form.get(low_name, '').strip()
+    high = form.get(high_name, '').strip()
+    if not low and not high:
+        return default
+    try:
+        bounds = (float(low), float(high))
+    except ValueError:
+        raise ValueError(f'Both {low_name} and {high_name} must be numbers.')
+    if not all(np.isfinite(bounds)) or bounds[0] >= bounds[1]:
+        raise ValueError(f'{low_name} must be smaller than {high_name}.')
+    return bounds
+
+def read_grid_size(form, names, defaults, max_cells):
+    """Read the optional numbers of grid points along each axis"""
+    sizes = []
+    for name, default in zip(names, defaults):
+        value = form.get(name, '').strip()
+        try:
+            sizes.append(int(value) if value else default)
+        except ValueError:
+            raise ValueError(f'{name} must be a whole number.')
+    if min(sizes) < 2 or np.prod(sizes) > max_cells:
+        raise ValueError(f"{' and '.join(names)} must be at least 2, with at most {max_cells} cells in total.")
+    return sizes
+
+def read_field_options(form):
+    """Read the optional x_min, x_max, y_min, y_max, nx and ny fields of a field request"""
+    x_range = read_range(form, 'x_min', 'x_max', SLOPE_X_RANGE)
+    y_range = read_range(form, 'y_min', 'y_max', SLOPE_Y_RANGE)
+    nx, ny = read_grid_size(form, ('nx', 'ny'), SLOPE_GRID, MAX_SLOPE_CELLS)
+    return x_range, y_range, nx, ny
+
+def read_family_option(form):
+    """
+    Read the optional family and members fields: the number of family members
+    to plot, or None to plot the single solution with its constants set to 1.
+    """
+    if not read_flag(form, 'family'):
+        return None
+    members = form.get('members', '').strip()
+    if not members:
+        return FAMILY_MEMBERS
+    try:
+        members = int(members)
+    except ValueError:
+        raise ValueError('members must be a whole number.')
+    if not 1 <= members <= MAX_FAMILY_MEMBERS:
+        raise ValueError(f'members must be between 1 and {MAX_FAMILY_MEMBERS}.')
+    return members
+
+def normalize_equation(equation):
+    """Normalize the equation for analysis"""
+    # Clean up the equation
+    normalized = equation.strip()
+    
+    # Make sure there's a right-hand side
+    if "=" not in normalized:
+        normalized = f"{normalized} = 0"
         
-    except Exception as e:
-        print(f"Parsing error in symbolic analysis: {e}")
-        # Could not analyze symbolically, rely on string pattern matching
-        return True  # Return True as we already checked patterns
+    # Parse to standard form: F(x,y,y',y'',...) = 0
+    left_side, right_side = normalized.split("=", 1)
+    normalized = f"{left_side.strip()} - ({right_side.strip()}) = 0"
+    
+    print(f"Normalized equation: {normalized}")
+    return normalized
 
-def verify_simple_solution(de, solution):
-    """Verify if a function is a solution to a differential equation"""
+def verify_simple_solution(de, solution, domain=None, num_points=None, lane=None):
+    """
+    Verify if a function is a solution to a differential equation, in the
+    sandbox lane the inputs were admitted to (admitted here when lane is None)
+    """
     # Normalize inputs for comparison
     normalized_de = normalize_equation(de)
     
-    # Call the core verification algorithm
+    # Call the core verification algorithm, unless any worker on this node
+    # already did for the same inputs
+    if lane is None:
+        lane = admit(de, solution)
     try:
-        result = verify_with_sympy(de, solution)
-        return result
+        parts = (canonicalize(de), canonicalize(solution),
+                 list(domain) if domain else None, num_points or DEFAULT_POINTS)
+        return VERDICT_STORE.get_or_compute(
+            'verification', parts, lambda: lane.run(verify_with_sympy, de, solution, domain, num_points)
+        )
+    except BudgetExceeded:
+        raise
     except Exception as e:
         print(f"Verification algorithm failed with error: {str(e)}")
         return {
@@ -428,301 +726,147 @@ def verify_simple_solution(de, solution):
             'reason': f"Verification failed. The algorithm couldn't determine if this is a valid solution. Error: {str(e)}"
         }
 
-def verify_with_sympy(de, solution):
-    """Verify if a solution satisfies a differential equation using SymPy
-    
-    Uses symbolic math to:
-    1. Parse the solution expression
-    2. Compute necessary derivatives
-    3. Substitute into the original equation
-    4. Check if the equation is satisfied at multiple points
+def generate_solution_plot(de, solution, render_errors=False, members=None, lane=None):
     """
-    try:
-        # Create symbols
-        x = symbols('x')
-        y_func = Function('y')(x)
-        
-        # Parse the solution
-        if "y = " not in solution:
-            return {
-                'is_valid': False,
-                'reason': "Solution must be in the form 'y = f(x)'"
-            }
-        
-        y_expr = solution.split("y = ")[1].replace("^", "**").replace("e**", "exp")
-        
-        try:
-            y_solution = parse_expr(y_expr)
-            print(f"Parsed solution: {y_solution}")
-        except Exception as e:
-            print(f"Failed to parse solution: {e}")
-            return {
-                'is_valid': False,
-                'reason': "Could not parse the solution. Try using standard notation."
+    Return the plot fields of a response for the solution of the differential
+    equation: plot_url and, when the solution could be sampled, the
+    singularities found on the plotted range. With members, up to that many
+    members of the solution family are drawn instead, and the fields name the
+    constants and their values for each member.
+    
+    Plots are kept in the content-addressed plot store, named by the canonical
+    equation and solution, the plotted range and the plot style, so a repeat
+    request skips rendering and the browser can cache the image. The sampled
+    curve is cached separately, so the singularities of a known solution cost
+    nothing either.
+    
+    A solution that cannot be plotted costs no rendering: plot_url is a small
+    static placeholder and plot_error says what went wrong. Only when
+    render_errors is set is a full image of the error message drawn (and
+    stored like any other plot).
+    
+    The work runs in lane, the sandbox pool the inputs were admitted to;
+    without one they are admitted here.
+    """
+    # Check if matplotlib is available
+    if not MATPLOTLIB_AVAILABLE:
+        return {
+            'plot_url': PLACEHOLDER_URL,
+            'plot_error': {
+                'code': 'plotting_unavailable',
+                'message': 'Plotting is not available on this server.'
             }
-            
-        # Parse the differential equation
-        if "=" not in de:
-            de = f"{de} = 0"  # Add right side if missing
-            
-        lhs, rhs = de.split("=", 1)
-        lhs = lhs.strip()
-        rhs = rhs.strip()
-        
-        # Equation in standard form: lhs - rhs = 0
-        eq_str = f"{lhs} - ({rhs})"
-        
-        # Replace derivatives with expressions containing the solution
-        derivatives = {
-            "y''": str(diff(y_solution, x, 2)),
-            "y'": str(diff(y_solution, x)),
-            "y": str(y_solution)
         }
-        
-        # Apply replacements from longest to shortest to avoid partial matches
-        for old, new in sorted(derivatives.items(), key=lambda x: -len(x[0])):
-            eq_str = eq_str.replace(old, f"({new})")
-            
-        # Convert to Python syntax and parse
-        eq_str = eq_str.replace("^", "**")
-        try:
-            eq_expr = parse_expr(eq_str)
-            print(f"Substituted equation: {eq_expr}")
-        except Exception as e:
-            print(f"Error parsing equation with substitutions: {e}")
+    
+    if lane is None:
+        lane = admit(de, solution)
+    try:
+        if members:
+            family = sample_family(solution, members, run=lane.run)
+            digest = plot_key(PLOT_STYLE, 'family', canonicalize(de), canonicalize(solution), PLOT_RANGE, members)
+            store_plot(digest, lambda: lane.run(render_family, de, solution, family))
             return {
-                'is_valid': False,
-                'reason': f"Could not evaluate the equation with your solution: {e}"
+                'plot_url': f"/plots/{digest}.png",
+                'family': {'constants': family.constants, 'values': family.values.tolist()}
             }
-            
-        # Evaluate at multiple points
-        test_points = [-2, -1, -0.5, 0, 0.5, 1, 2]
-        valid_points = 0
-        invalid_point = None
-        invalid_value = None
-        
-        for point in test_points:
-            try:
-                value = float(eq_expr.subs(x, point))
-                print(f"At x={point}: {value}")
-                
-                if abs(value) < 1e-6:  # Close enough to zero
-                    valid_points += 1
-                else:
-                    if invalid_point is None:
-                        invalid_point = point
-                        invalid_value = value
-            except Exception as e:
-                print(f"Evaluation error at x={point}: {e}")
-                continue
-                
-        # Determine if the solution is valid
-        min_valid_points = 4  # Require at least 4 valid points
         
-        if valid_points >= min_valid_points:
-            return {
-                'is_valid': True,
-                'reason': f"Solution verified at {valid_points} different points."
-            }
-        else:
-            reason = "Could not verify the solution at enough points."
-            if invalid_point is not None:
-                reason = f"The equation is not satisfied at x = {invalid_point}. Value: {invalid_value} ≠ 0"
+        curve = sample_solution(solution, run=lane.run)
+        digest = plot_key(PLOT_STYLE, canonicalize(de), canonicalize(solution), PLOT_RANGE)
+        store_plot(digest, lambda: lane.run(render_curve, de, solution, curve))
+        return {'plot_url': f"/plots/{digest}.png", 'singularities': curve.singularities}
+    except PlotError as e:
+        print(f"Error generating plot: {e.message}")
+        if not render_errors:
+            return {'plot_url': PLACEHOLDER_URL, 'plot_error': e.to_dict()}
         
-        return {
-            'is_valid': False,
-                'reason': reason
-        }
-                
-    except Exception as e:
-        print(f"Error in verification process: {e}")
-        return {
-            'is_valid': False,
-            'reason': f"Verification error: {e}"
-        }
+        error = e
+        error_digest = plot_key(PLOT_STYLE, 'error', error.code, error.message)
+        store_plot(error_digest, lambda: lane.run(render_error_plot, error))
+        return {'plot_url': f"/plots/{error_digest}.png", 'plot_error': e.to_dict()}
+    except BudgetExceeded as e:
+        print(f"Plot over budget: {e.message}")
+        return {'plot_url': PLACEHOLDER_URL, 'plot_error': e.to_dict()}
+
+def store_plot(digest, render):
+    """
+    Render and store the plot named digest unless it is stored already.
+    Identical requests in flight at the same time, in any worker, render it
+    once and share the stored image.
+    """
+    if PLOT_STORE.has(digest):
+        return
+    
+    def build():
+        PLOT_STORE.put(digest, render())
+        return digest
+    
+    SINGLE_FLIGHT.do(('plot', digest), build,
+                     lookup=lambda: digest if PLOT_STORE.has(digest, count=False) else None)
 
-def generate_solution_plot(de, solution):
-    """Generate a plot for the solution of the differential equation"""
-    # Check if matplotlib is available
-    if not MATPLOTLIB_AVAILABLE:
-        return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVQI12P4//8/AAX+Av7czFnnAAAAAElFTkSuQmCC"
+def generate_plot_data(solution, members=None, lane=None):
+    """
+    Return the plot fields of a response for clients that draw the plot
+    themselves: plot_data with the sampled curve (see plot_data.curve_payload)
+    or, with members, the sampled family (plot_data.family_payload), or
+    plot_error when the solution cannot be sampled. Nothing is rendered.
+    Sampling runs in lane, or in the one the solution is admitted to here.
+    """
+    if lane is None:
+        lane = admit(solution)
+    try:
+        if members:
+            return {'plot_data': family_payload(sample_family(solution, members, run=lane.run))}
+        return {'plot_data': curve_payload(sample_solution(solution, run=lane.run))}
+    except PlotError as e:
+        print(f"Error sampling plot data: {e.message}")
+        return {'plot_error': e.to_dict()}
+    except BudgetExceeded as e:
+        # The verdict stands; only the plot is missing
+        print(f"Plot data over budget: {e.message}")
+        return {'plot_error': e.to_dict()}
+
+# Sampled curve of a solution, for client-side plotting
+@app.route('/plot_data', methods=['GET', 'POST'])
+def plot_data():
+    solution = request.values.get('solution', '')
+    if not solution:
+        return jsonify({
+            'status': 'error',
+            'message': 'Please enter a solution to sample.'
+        }), 400
     
-    # Default base64 image to return if plotting fails or matplotlib is not available
+    lane = admit(solution)
     try:
-        # Extract the solution function from the input
-        if "y = " in solution:
-            y_expr = solution.split("y = ")[1]
-        else:
-            y_expr = solution
-        
-        # Set up SymPy for parsing
-        x_sym = symbols('x')
-        
-        # Parse the solution using SymPy
-        y_expr_clean = y_expr.replace('^', '**').replace('e**', 'exp')
-        
-        # Handle constants by replacing them with numeric values for plotting
-        # Replace common constants with numeric values
-        for const in ['C', 'C1', 'C2']:
-            if const in y_expr_clean:
-                y_expr_clean = y_expr_clean.replace(const, '1')  # Use 1 as default value
-        
-        # Now parse the expression with numeric constants
-        try:
-            y_sym = parse_expr(y_expr_clean)
-            print(f"Parsed solution for plotting: {y_sym}")
-        except Exception as e:
-            print(f"Error parsing solution for plotting: {e}")
-            
-            # Create a simplified error plot
-            plt.figure(figsize=(8, 5))
-            plt.text(0.5, 0.5, f"Could not parse: {y_expr}\nError: {str(e)}", 
-                    horizontalalignment='center', verticalalignment='center',
-                    transform=plt.gca().transAxes, fontsize=12)
-            plt.tight_layout()
-            
-            # Save the error message plot
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=100)
-            buf.seek(0)
-            plot_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-            
-            return f"data:image/png;base64,{plot_url}"
-        
-        # Create a numerical function from symbolic expression
-        try:
-            y_func = lambdify(x_sym, y_sym, modules=['numpy'])
-        except Exception as e:
-            print(f"Error creating numerical function: {e}")
-            
-            # Create a simplified error plot
-            plt.figure(figsize=(8, 5))
-            plt.text(0.5, 0.5, f"Could not create plot function: {str(e)}", 
-                    horizontalalignment='center', verticalalignment='center',
-                    transform=plt.gca().transAxes, fontsize=12)
-            plt.tight_layout()
-            
-            # Save the error message plot
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=100)
-            buf.seek(0)
-            plot_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-            
-            return f"data:image/png;base64,{plot_url}"
-        
-        # Generate x values for plotting
-        x = np.linspace(-5, 5, 500)
-        
-        try:
-            # Try to evaluate the function
-            y = y_func(x)
-            
-            # Handle NaN and infinities
-            y = np.array(y, dtype=float)  # Convert to float array
-            valid_indices = np.isfinite(y)
-            
-            if not np.any(valid_indices):
-                raise ValueError("No valid points to plot - function may have singularities everywhere in this range")
-                
-            x_valid = x[valid_indices]
-            y_valid = y[valid_indices]
-            
-            # Limit y values to a reasonable range for display
-            y_max = 10
-            display_indices = np.abs(y_valid) < y_max
-            x_display = x_valid[display_indices]
-            y_display = y_valid[display_indices]
-            
-            # Create the plot
-            plt.figure(figsize=(8, 5))
-            
-            if len(x_display) > 0:
-                plt.plot(x_display, y_display, linewidth=2.5, color='#2A93D5')
-            else:
-                plt.text(0.5, 0.5, "Function values out of displayable range", 
-                        horizontalalignment='center', verticalalignment='center',
-                        transform=plt.gca().transAxes, fontsize=12)
-            
-            # Add singularity markers if detected
-            singularities = []
-            for i in range(len(x) - 1):
-                if valid_indices[i] and not valid_indices[i + 1] or not valid_indices[i] and valid_indices[i + 1]:
-                    singularities.append((x[i] + x[i+1]) / 2)
-            
-            for sing in singularities[:3]:  # Limit to 3 singularities to avoid clutter
-                plt.axvline(x=sing, color='r', linestyle='--', alpha=0.5)
-            
-            if singularities:
-                plt.axvline(x=singularities[0], color='r', linestyle='--', alpha=0.5, 
-                            label='Singularity')
-                plt.legend()
-            
-            # Make the plot more informative and attractive
-            plt.title(f"Solution: {solution}", fontsize=14)
-            plt.xlabel("x", fontsize=12)
-            plt.ylabel("y", fontsize=12)
-            plt.grid(True, alpha=0.3)
-            plt.axhline(y=0, color='k', linestyle='-', alpha=0.2)
-            plt.axvline(x=0, color='k', linestyle='-', alpha=0.2)
-            
-            # Show differential equation on the plot
-            plt.figtext(0.5, 0.01, f"DE: {de}", ha='center', fontsize=10)
-            
-            # Add some spacing around the plot
-            plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-            
-            # Save the plot to a bytes buffer
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=100)
-            buf.seek(0)
-            
-            # Convert the buffer to a base64 string
-            plot_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-            
-            return f"data:image/png;base64,{plot_url}"
-            
-        except Exception as calc_error:
-            print(f"Error calculating function values: {calc_error}")
-            
-            # Create a simplified plot just with the equation
-            plt.figure(figsize=(8, 5))
-            plt.text(0.5, 0.5, f"Could not plot: {y_expr}\nError: {str(calc_error)}", 
-                    horizontalalignment='center', verticalalignment='center',
-                    transform=plt.gca().transAxes, fontsize=12)
-            plt.tight_layout()
-            
-            # Save the error plot
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=100)
-            buf.seek(0)
-            plot_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-            
-            return f"data:image/png;base64,{plot_url}"
-            
-    except Exception as e:
-        print(f"Error generating plot: {e}")
-        
-        # Create a fallback error plot
-        if MATPLOTLIB_AVAILABLE:
-            plt.figure(figsize=(8, 5))
-            plt.text(0.5, 0.5, f"Error generating plot: {str(e)}", 
-                    horizontalalignment='center', verticalalignment='center',
-                    transform=plt.gca().transAxes, fontsize=12)
-            plt.tight_layout()
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=100)
-            buf.seek(0)
-            plot_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-            
-            return f"data:image/png;base64,{plot_url}"
-        
-        return "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVQI12P4//8/AAX+Av7czFnnAAAAAElFTkSuQmCC"
+        curve = sample_solution(solution, run=lane.run)
+    except PlotError as e:
+        return jsonify({
+            'status': 'error',
+            'message': e.message,
+            'plot_error': e.to_dict()
+        }), 422
+    
+    # Raw float32 x values followed by y values; the rest goes in a header
+    if request.values.get('encoding', '').strip().lower() == 'binary':
+        response = app.response_class(curve_bytes(curve), mimetype='application/octet-stream')
+        response.headers['X-Plot-Data'] = json.dumps(curve_metadata(curve))
+        return response
+    
+    return jsonify(dict(curve_payload(curve), status='success'))
+
+# Plots rendered by generate_solution_plot, named by content
+@app.route('/plots/<digest>.png')
+def plot_image(digest):
+    png = PLOT_STORE.get(digest) if DIGEST_RE.match(digest) else None
+    if png is None:
+        abort(404)
+    
+    # The name is the hash of the content, so it can be cached forever
+    response = app.response_class(png, mimetype='image/png')
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
 
 # Health check endpoint
 @app.route('/health')
@@ -733,6 +877,30 @@ def health_check():
         'timestamp': datetime.datetime.utcnow().isoformat() + 'Z'
     })
 
+# Cache statistics endpoint
+@app.route('/stats')
+def stats():
+    # Parsing, derivatives and compiled equations are cached inside the
+    # sandbox workers (and here when there are none); curves and
+    # trajectories are cached here
+    workers = ADMISSION.cache_stats()
+    
+    def combined(name, cache):
+        return merge_stats([cache.stats()] + ([workers[name]] if name in workers else []))
+    
+    return jsonify({
+        'parse_cache': combined('parse_cache', PARSE_CACHE),
+        'derivative_cache': combined('derivative_cache', DERIVATIVE_CACHE),
+        'ode_cache': combined('ode_cache', ODE_CACHE),
+        'curve_cache': CURVE_CACHE.stats(),
+        'trajectory_cache': TRAJECTORY_CACHE.stats(),
+        'plot_store': PLOT_STORE.stats(),
+        'verdict_store': VERDICT_STORE.stats(),
+        'single_flight': SINGLE_FLIGHT.stats(),
+        'admission': ADMISSION.stats(),
+        'jobs': JOB_STORE.stats()
+    })
+
 # Request logging middleware
 @app.before_request
 def before_request():
@@ -754,6 +922,26 @@ def internal_error(error):
     log_error(app, error, "500 Internal Server Error")
     return render_template('errors/500.html'), 500
 
+# Symbolic work that overran its CPU, memory or time budget in the sandbox
+@app.errorhandler(BudgetExceeded)
+def budget_exceeded(error):
+    log_error(app, error, "Budget Exceeded")
+    return jsonify({
+        'status': 'error',
+        'message': error.message,
+        'budget_exceeded': error.to_dict()
+    }), 422
+
+# Input over a hard cost ceiling, rejected before it was parsed
+@app.errorhandler(CostExceeded)
+def cost_exceeded(error):
+    log_error(app, error, "Cost Exceeded")
+    return jsonify({
+        'status': 'error',
+        'message': error.message,
+        'cost_exceeded': error.to_dict()
+    }), error.status
+
 @app.errorhandler(Exception)
 def unhandled_exception(error):
     log_error(app, error, "Unhandled Exception")
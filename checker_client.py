@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Drop-in replacement for running the checker scripts once per call.
+
+Instead of
+
+    subprocess.run([python, 'solution_verifier.py', de, solution])
+
+and parsing its stdout, use
+
+    run_checker('solution_verifier.py', de, solution)
+
+which starts the script once with --serve, keeps it running and sends it one
+JSON-lines request per call. With socket_path the client talks to a daemon
+started separately with --serve --socket PATH instead.
+
+From the command line it takes the same arguments as the scripts, prints
+the same JSON and exits with the same status:
+
+    python checker_client.py linearity_checker.py "y' + y = x"
+"""
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class CheckerClient:
+    """A connection to one resident checker script."""
+
+    def __init__(self, script, socket_path=None, python=sys.executable):
+        self.script = script if os.path.isabs(script) else os.path.join(HERE, script)
+        self.socket_path = socket_path
+        self.python = python
+        self._process = None
+        self._socket = None
+        self._reader = None
+        self._writer = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.socket_path:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(self.socket_path)
+            self._reader = self._socket.makefile('r', encoding='utf-8')
+            self._writer = self._socket.makefile('w', encoding='utf-8')
+        else:
+            self._process = subprocess.Popen(
+                [self.python, self.script, '--serve'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                cwd=os.path.dirname(self.script),
+                text=True,
+                encoding='utf-8',
+            )
+            self._reader = self._process.stdout
+            self._writer = self._process.stdin
+
+    def _exchange(self, request):
+        if self._reader is None:
+            self._connect()
+        self._writer.write(json.dumps(request) + '\n')
+        self._writer.flush()
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError(f"{os.path.basename(self.script)} closed the connection")
+        return json.loads(line)
+
+    def call(self, *args):
+        """Send the script's positional arguments and return its JSON result."""
+        return self.call_status(*args)[0]
+
+    def call_status(self, *args):
+        """
+        Like call, but return (result, exit code), the status the one-shot
+        script would have exited with.
+        """
+        request = {'id': next(self._ids), 'args': [str(arg) for arg in args]}
+        with self._lock:
+            try:
+                response = self._exchange(request)
+            except (OSError, ValueError):
+                # The daemon died or the pipe broke; start over once
+                self.close()
+                response = self._exchange(request)
+        response.pop('id', None)
+        exit_code = response.pop('exit_code', 0)
+        return response, exit_code
+
+    def close(self):
+        for stream in (self._writer, self._reader):
+            try:
+                if stream is not None:
+                    stream.close()
+            except OSError:
+                pass
+        if self._socket is not None:
+            self._socket.close()
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = self._socket = self._reader = self._writer = None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(script, socket_path):
+    key = (script, socket_path)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = CheckerClient(script, socket_path)
+    return client
+
+
+def run_checker(script, *args, socket_path=None):
+    """Run a checker script through a shared resident client."""
+    return _shared_client(script, socket_path).call(*args)
+
+
+def run_checker_status(script, *args, socket_path=None):
+    """Like run_checker, but return (result, exit code of the one-shot script)."""
+    return _shared_client(script, socket_path).call_status(*args)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(json.dumps({
+            'status': 'error',
+            'message': 'Usage: checker_client.py SCRIPT [ARGS...]'
+        }))
+        sys.exit(1)
+
+    socket_path = os.environ.get('CHECKER_SOCKET')
+    response, exit_code = run_checker_status(sys.argv[1], *sys.argv[2:], socket_path=socket_path)
+    print(json.dumps(response))
+    if exit_code:
+        sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
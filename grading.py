@@ -0,0 +1,203 @@
+"""
+Grade many candidate solutions against one differential equation.
+
+The equation is parsed once and compiled once into a NumPy function of x,
+placeholder arrays for y, y', ... and any constants. All candidates are
+differentiated symbolically, compiled together in a single lambdify call and
+evaluated on one shared grid, so the equation residual for the whole class is
+a single broadcasted call over an array of shape (candidates, constant sets,
+points).
+"""
+import numpy as np
+from sympy import Abs, Add, Derivative, Dummy
+from sympy.utilities.lambdify import lambdify
+
+from ode_parser import X, Y
+from parse_cache import cached_parse_equation, cached_parse_expression
+from verification import (
+    ATOL, CONSTANT_SETS, DEFAULT_DOMAIN, DEFAULT_POINTS, MAX_POINTS,
+    MIN_VALID_POINTS, REFINE_LIMIT, RTOL, constant_column, derivative_orders,
+    real_array, sample_points, solution_derivative, substitute_solution,
+    summarize_verdict, verify_residual, within_tolerance,
+)
+
+# Upper bound on candidates per grading request
+MAX_CANDIDATES = 1000
+
+
+class CompiledEquation:
+    """
+    A differential equation compiled once into a NumPy function.
+
+    y(x) and its Derivative atoms are replaced by placeholder symbols, so the
+    residual and its term scale can be evaluated from arrays of solution and
+    derivative values without knowing the solution symbolically.
+    """
+
+    def __init__(self, de_expr, x=X, y=Y):
+        yx = y(x)
+        self.expr = de_expr
+        self.x = x
+        self.orders = derivative_orders(de_expr, x, y)
+        self.placeholders = [Dummy(f'y{order}') for order in self.orders]
+        replacements = {
+            (yx if order == 0 else Derivative(yx, (x, order))): placeholder
+            for order, placeholder in zip(self.orders, self.placeholders)
+        }
+        residual = de_expr.xreplace(replacements)
+        scale = Add(*[Abs(term) for term in Add.make_args(residual)])
+        self.constants = sorted(residual.free_symbols - {x} - set(self.placeholders), key=str)
+        self.func = lambdify(
+            [x] + self.placeholders + self.constants,
+            [residual, scale],
+            modules='numpy',
+        )
+
+
+def _parse_candidate(solution):
+    if "y = " not in solution:
+        raise ValueError("Solution must be in the form 'y = f(x)'")
+    try:
+        return cached_parse_expression(solution.split("y = ")[1])
+    except Exception:
+        raise ValueError("Could not parse the solution. Try using standard notation.")
+
+
+def _evaluate_terms(equation, candidates, points, constants, sets):
+    """
+    Evaluate every candidate's solution terms on the grid.
+
+    Returns {index: [array per derivative order]} with arrays of shape
+    (sets, points), and {index: error message} for candidates that could not
+    be evaluated. All candidates are compiled in one lambdify call; if that
+    fails because of one bad candidate, they are retried one at a time.
+    """
+    x = equation.x
+    row = points.reshape(1, -1)
+    columns = [constant_column(c, sets) for c in constants]
+    shape = (sets, points.size)
+
+    def evaluate(batch):
+        func = lambdify([x] + constants, [terms for _, terms in batch], modules='numpy')
+        with np.errstate(all='ignore'):
+            outputs = func(row, *columns)
+        return {
+            index: [real_array(values, shape) for values in output]
+            for (index, _), output in zip(batch, outputs)
+        }
+
+    try:
+        return evaluate(candidates), {}
+    except Exception:
+        values, errors = {}, {}
+        for candidate in candidates:
+            try:
+                values.update(evaluate([candidate]))
+            except Exception as e:
+                errors[candidate[0]] = (
+                    f"Could not verify the solution at enough points. Evaluation error: {e}"
+                )
+        return values, errors
+
+
+def grade_solutions(de, solutions, domain=None, num_points=None,
+                    rtol=RTOL, atol=ATOL, min_valid_points=MIN_VALID_POINTS):
+    """
+    Verify a list of candidate solutions against one differential equation.
+
+    Every candidate is checked on the same grid over domain (default [-2, 2]).
+    Points where a candidate or its derivatives are not finite are skipped for
+    that candidate. Candidates that fail at only a few isolated points, or
+    that are defined at too few points of the default domain, get a second
+    opinion from the single-solution verifier.
+
+    Returns one dict per candidate, in input order, with the same fields as
+    verify_with_sympy plus the solution text.
+    """
+    if len(solutions) > MAX_CANDIDATES:
+        raise ValueError(f"At most {MAX_CANDIDATES} solutions can be graded at once.")
+
+    de_expr = cached_parse_equation(de)
+    equation = CompiledEquation(de_expr)
+    x = equation.x
+
+    requested_domain = tuple(domain) if domain is not None else None
+    domain = requested_domain or DEFAULT_DOMAIN
+    num_points = min(num_points or DEFAULT_POINTS, MAX_POINTS)
+    points = sample_points(domain, num_points)
+
+    results = [None] * len(solutions)
+    candidates = []
+    parsed = {}
+    for index, solution in enumerate(solutions):
+        try:
+            y_solution = _parse_candidate(solution)
+        except ValueError as e:
+            results[index] = {'is_valid': False, 'reason': str(e), 'domain': domain}
+            continue
+        parsed[index] = y_solution
+        terms = [solution_derivative(y_solution, order, x) for order in equation.orders]
+        candidates.append((index, terms))
+
+    # One set of constant values shared by the equation and every candidate
+    constants = set(equation.constants)
+    for _, terms in candidates:
+        for term in terms:
+            constants |= term.free_symbols
+    constants.discard(x)
+    constants = sorted(constants, key=str)
+    sets = CONSTANT_SETS if constants else 1
+
+    term_values, errors = _evaluate_terms(equation, candidates, points, constants, sets)
+    for index, reason in errors.items():
+        results[index] = {'is_valid': False, 'reason': reason, 'domain': domain}
+
+    graded = [index for index, _ in candidates if index in term_values]
+    if graded:
+        # Stack to (candidates, sets, points) and evaluate the equation once
+        stacked = [
+            np.stack([term_values[index][k] for index in graded])
+            for k in range(len(equation.orders))
+        ]
+        equation_columns = [
+            constant_column(c, sets).reshape(1, sets, 1) for c in equation.constants
+        ]
+        with np.errstate(all='ignore'):
+            residual, scale = equation.func(points.reshape(1, 1, -1), *stacked, *equation_columns)
+        shape = (len(graded), sets, points.size)
+        residual = real_array(residual, shape)
+        scale = real_array(scale, shape)
+
+        defined = np.isfinite(residual) & np.isfinite(scale)
+        for values in stacked:
+            defined &= np.isfinite(values)
+        usable = defined.all(axis=1)
+        satisfied = within_tolerance(residual, scale, rtol, atol).all(axis=1)
+        valid_counts = np.count_nonzero(usable & satisfied, axis=1)
+        failing_masks = usable & ~satisfied
+
+        for row, index in enumerate(graded):
+            failing = np.flatnonzero(failing_masks[row])
+            isolated = 0 < failing.size <= REFINE_LIMIT
+            undersampled = (not failing.size and valid_counts[row] < min_valid_points
+                            and requested_domain is None)
+            if isolated or undersampled:
+                # Isolated failures may be round-off next to a pole, and a
+                # solution defined only outside the default domain needs its
+                # own domain inferred
+                eq_expr, solution_terms = substitute_solution(de_expr, parsed[index], x)
+                result = verify_residual(eq_expr, solution_terms, x, domain=requested_domain,
+                                         num_points=num_points, rtol=rtol, atol=atol,
+                                         min_valid_points=min_valid_points)
+            else:
+                result = summarize_verdict(points, residual[row], failing,
+                                           int(valid_counts[row]), domain, min_valid_points)
+            results[index] = {
+                'is_valid': result['is_valid'],
+                'reason': result['reason'],
+                'domain': result['domain'],
+            }
+
+    for solution, result in zip(solutions, results):
+        result['solution'] = solution
+    return results
@@ -0,0 +1,225 @@
+"""
+Numerical initial-value solver for equations with no closed-form solution.
+
+The equation is put in explicit form and compiled once (see ode_system), then
+integrated with the adaptive Dormand-Prince 5(4) Runge-Kutta pair. Every
+initial condition is one column of a (order, trajectories) state array, and
+each stage evaluates the right-hand side for all columns in one NumPy call.
+Step sizes are controlled per trajectory, so one stiff or blowing-up
+trajectory does not slow the others down; finished trajectories just stop
+moving.
+
+Steps are shortened to land on the output grid, so trajectories are reported
+at the same x values without interpolation.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from ode_system import compile_ode
+from plot_data import encode_array
+
+# Dormand-Prince 5(4) tableau
+_C = np.array([0.0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1.0, 1.0])
+_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+# Fifth-order weights are the last row of _A (first same as last); the error
+# estimate is the difference to the embedded fourth-order solution
+_B = np.array(_A[6] + [0.0])
+_E = _B - np.array([5179 / 57600, 0.0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100, 1 / 40])
+
+RTOL = 1e-6
+ATOL = 1e-9
+
+# Request limits
+MAX_TRAJECTORIES = 1000
+DEFAULT_IVP_POINTS = 201
+MAX_IVP_POINTS = 2000
+
+# Accepted plus rejected steps per direction, for all trajectories together
+MAX_STEPS = 20000
+
+# A trajectory is stopped once its state grows beyond this
+BLOWUP = 1e8
+
+# Step size control
+_SAFETY = 0.9
+_MIN_FACTOR = 0.2
+_MAX_FACTOR = 5.0
+
+# Per-trajectory outcome
+OK, BLOWUP_STATUS, STEP_FAILED = 'ok', 'blowup', 'step_failed'
+
+class InitialConditionError(ValueError):
+    """Initial conditions that do not match the order of the equation."""
+
+
+# x: (points,); states: (order, trajectories, points), NaN after a trajectory
+# stops; status and x_stop: per trajectory; steps and rejected: totals
+Trajectories = namedtuple('Trajectories', 'x states status x_stop steps rejected')
+
+
+def _norm(error, u, u_new, rtol, atol):
+    """RMS error of each trajectory, scaled by the tolerances."""
+    scale = atol + rtol * np.maximum(np.abs(u), np.abs(u_new))
+    with np.errstate(invalid='ignore', over='ignore'):
+        norm = np.sqrt(np.mean((error / scale) ** 2, axis=0))
+    return np.where(np.isfinite(norm), norm, np.inf)
+
+
+def _integrate(system, x0, u0, x_out, rtol, atol, max_steps):
+    """
+    Integrate from x0 through the monotonic output points x_out (all on the
+    same side of x0) for every column of u0. Returns (states at x_out,
+    status, x_stop, steps, rejected).
+    """
+    order, count = u0.shape
+    out = np.full((order, count, x_out.size), np.nan)
+    status = np.full(count, OK, dtype=object)
+    x_stop = np.full(count, np.nan)
+    if not x_out.size:
+        return out, status, x_stop, 0, 0
+
+    direction = np.sign(x_out[-1] - x0)
+    span = abs(x_out[-1] - x0)
+    x = np.full(count, float(x0))
+    u = u0.astype(float)
+    h = np.full(count, direction * span / 100.0)
+    # Steps smaller than this relative to the span mean the solver is stuck
+    h_min = 1e-12 * max(span, abs(x0), 1.0)
+    target_index = np.zeros(count, dtype=int)
+    active = np.ones(count, dtype=bool)
+
+    k = np.empty((7, order, count))
+    k[0] = system(x, u)
+    steps = rejected = 0
+
+    while active.any() and steps < max_steps:
+        steps += 1
+        target = x_out[np.minimum(target_index, x_out.size - 1)]
+        # Shorten steps that would overshoot the next output point
+        h_step = np.where(active, direction * np.minimum(np.abs(h), np.abs(target - x)), 0.0)
+
+        with np.errstate(all='ignore'):
+            for stage in range(1, 7):
+                du = np.tensordot(_A[stage], k[:stage], axes=1)
+                k[stage] = system(x + _C[stage] * h_step, u + h_step * du)
+            u_new = u + h_step * np.tensordot(_B[:6], k[:6], axes=1)
+            error = h_step * np.tensordot(_E, k, axes=1)
+
+        err = _norm(error, u, u_new, rtol, atol)
+        accept = active & (err <= 1.0)
+        rejected += int(np.count_nonzero(active & ~accept))
+
+        # Accepted steps move on; the last stage is the next step's first (FSAL)
+        reached = accept & (np.abs(target - (x + h_step)) <= h_min)
+        x = np.where(accept, np.where(reached, target, x + h_step), x)
+        u = np.where(accept, u_new, u)
+        k[0] = np.where(accept, k[6], k[0])
+
+        columns = np.flatnonzero(reached)
+        out[:, columns, target_index[columns]] = u[:, columns]
+        target_index[columns] += 1
+        active &= target_index < x_out.size
+
+        with np.errstate(divide='ignore'):
+            factor = np.clip(_SAFETY * err ** -0.2, _MIN_FACTOR, _MAX_FACTOR)
+        # A step that was cut short to hit an output point says nothing
+        # about how large the next one can be
+        h = np.where(accept & (np.abs(h_step) < np.abs(h)), h, h_step * factor)
+
+        blowup = active & accept & ~(np.abs(u) <= BLOWUP).all(axis=0)
+        stuck = active & ~accept & (np.abs(h) < h_min)
+        for mask, outcome in ((blowup, BLOWUP_STATUS), (stuck, STEP_FAILED)):
+            status[mask] = outcome
+            x_stop[mask] = x[mask]
+            active &= ~mask
+
+    # Out of steps: report where each unfinished trajectory got to
+    status[active] = STEP_FAILED
+    x_stop[active] = x[active]
+    return out, status, x_stop, steps, rejected
+
+
+def solve_ivp(ode, x0, initial, x_range, points=DEFAULT_IVP_POINTS, rtol=RTOL, atol=ATOL, max_steps=MAX_STEPS):
+    """
+    Integrate an ExplicitODE for a batch of initial conditions.
+
+    initial is an array of shape (trajectories, order): y(x0), y'(x0), ...
+    for every trajectory. The solution is reported on points evenly spaced x
+    values over x_range, which must contain x0, integrating forwards and
+    backwards from x0. Returns Trajectories.
+    """
+    initial = np.asarray(initial, dtype=float).reshape(-1, ode.order)
+    u0 = initial.T
+    x = np.linspace(x_range[0], x_range[1], points)
+    states = np.full((ode.order, u0.shape[1], points), np.nan)
+
+    at_start = np.isclose(x, x0, rtol=0, atol=1e-12 * max(abs(x0), 1.0))
+    states[:, :, at_start] = u0[:, :, np.newaxis]
+    forward = np.flatnonzero((x > x0) & ~at_start)
+    backward = np.flatnonzero((x < x0) & ~at_start)[::-1]
+
+    status = np.full(u0.shape[1], OK, dtype=object)
+    x_stop = np.full(u0.shape[1], np.nan)
+    steps = rejected = 0
+    for indices in (forward, backward):
+        out, part_status, part_stop, part_steps, part_rejected = _integrate(
+            ode.system, x0, u0, x[indices], rtol, atol, max_steps
+        )
+        states[:, :, indices] = out
+        # Either direction failing marks the trajectory
+        failed = (part_status != OK) & (status == OK)
+        status[failed] = part_status[failed]
+        x_stop[failed] = part_stop[failed]
+        steps += part_steps
+        rejected += part_rejected
+
+    return Trajectories(x, states, status.tolist(), x_stop, steps, rejected)
+
+
+def solve_equation(equation, x0, initial, x_range, points=DEFAULT_IVP_POINTS):
+    """
+    Compile the equation and integrate it for the initial conditions, lists
+    of order numbers each (or single numbers for a first-order equation).
+    Returns (order, names of other constants, Trajectories); raises
+    InitialConditionError when an initial condition has the wrong number of
+    values.
+    """
+    ode = compile_ode(equation)
+    rows = [row if isinstance(row, (list, tuple)) else [row] for row in initial]
+    if any(len(row) != ode.order for row in rows):
+        raise InitialConditionError(f"Each initial condition needs {ode.order} values: y(x0), y'(x0), ... in order."
+                         if ode.order > 1 else 'Each initial condition needs one value: y(x0).')
+    return ode.order, ode.constants, solve_ivp(ode, x0, rows, x_range, points)
+
+
+def trajectories_payload(trajectories):
+    """
+    Return trajectories as JSON-ready data: x, and y for every trajectory
+    one after the other (and y' likewise for higher-order equations), as
+    base64 float32 arrays.
+    """
+    order, count, points = trajectories.states.shape
+    payload = {
+        'points': points,
+        'trajectories': count,
+        'dtype': 'float32',
+        'byte_order': 'little',
+        'x': encode_array(trajectories.x),
+        'y': encode_array(trajectories.states[0]),
+        'status': trajectories.status,
+        'x_stop': [None if np.isnan(value) else float(value) for value in trajectories.x_stop],
+        'steps': trajectories.steps,
+        'rejected_steps': trajectories.rejected,
+    }
+    if order > 1:
+        payload['dy'] = encode_array(trajectories.states[1])
+    return payload
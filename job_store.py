@@ -0,0 +1,213 @@
+"""
+Asynchronous jobs: a request returns a job id at once and its parts (the
+verdict, the plot) are computed in parallel in the background.
+
+Job state lives in SQLite, so any worker process on the node can answer a
+poll or an event stream for a job another worker is running. JOB_DB names
+the database file; when it is empty the jobs live in a shared in-memory
+database of this process only (fine for a single worker). Each finished
+part is stored as soon as it is ready, so a client gets the fast verdict
+without waiting for the slow plot. Jobs expire JOB_TTL seconds after they
+were created.
+"""
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Empty to keep jobs in memory, visible to this process only
+JOB_DB = os.environ.get('JOB_DB', os.path.join(tempfile.gettempdir(), 'de-analyzer-jobs.sqlite3'))
+JOB_TTL = float(os.environ.get('JOB_TTL', 3600))
+
+# Threads running job parts; the symbolic work itself runs in the sandbox
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+
+# An event stream ends after this many seconds, finished or not
+JOB_STREAM_TIMEOUT = float(os.environ.get('JOB_STREAM_TIMEOUT', 120))
+
+# How often a stream looks for finished parts, and sends a keep-alive
+_WATCH_INTERVAL = 0.1
+_KEEPALIVE_INTERVAL = 15.0
+
+# Expired jobs are removed every _PURGE_EVERY created jobs
+_PURGE_EVERY = 100
+
+_MEMORY_URI = 'file:de-analyzer-jobs?mode=memory&cache=shared'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT NOT NULL,
+    part TEXT NOT NULL,
+    value TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (id, part)
+)
+"""
+
+# Job states
+PENDING, DONE = 'pending', 'done'
+
+
+class JobStore:
+    """
+    SQLite table of job parts: one row per part, with a JSON value once the
+    part is done. Each thread uses its own connection.
+    """
+
+    def __init__(self, path=JOB_DB, ttl=JOB_TTL, workers=JOB_WORKERS):
+        self.path = path
+        self.ttl = ttl
+        self.workers = workers
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._anchor = None
+        self._created = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection must not be used across fork (e.g. in the sandbox workers)
+        if conn is None or self._local.pid != os.getpid():
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            else:
+                conn = sqlite3.connect(_MEMORY_URI, uri=True, timeout=5.0, isolation_level=None,
+                                       check_same_thread=False)
+                with self._lock:
+                    # The in-memory database lives as long as one connection does
+                    if self._anchor is None:
+                        self._anchor = conn
+            conn.execute(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+            return self._executor
+
+    def submit(self, parts):
+        """
+        Start a job computing every part, a dict of name to a function
+        returning a JSON-serializable value, and return its id at once.
+        A part that raises stores {'status': 'error', 'message': ...}.
+        """
+        job_id = secrets.token_urlsafe(16)
+        now = time.time()
+        conn = self._connection()
+        conn.executemany(
+            'INSERT INTO jobs (id, part, value, created) VALUES (?, ?, NULL, ?)',
+            [(job_id, name, now) for name in parts],
+        )
+        with self._lock:
+            self._created += 1
+            purge = self._created % _PURGE_EVERY == 0
+        if purge:
+            conn.execute('DELETE FROM jobs WHERE created <= ?', (now - self.ttl,))
+
+        executor = self._get_executor()
+        for name, compute in parts.items():
+            executor.submit(self._run_part, job_id, name, compute)
+        return job_id
+
+    def _run_part(self, job_id, name, compute):
+        try:
+            value = compute()
+            self.completed += 1
+        except Exception as e:
+            logger.exception("Job %s part %s failed", job_id, name)
+            self.failed += 1
+            value = {'status': 'error', 'message': str(e)}
+        try:
+            self._connection().execute(
+                'UPDATE jobs SET value = ? WHERE id = ? AND part = ?', (json.dumps(value), job_id, name)
+            )
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Job store write failed: %s", e)
+
+    def get(self, job_id):
+        """
+        Return {'state': 'pending' or 'done', part: value or None, ...} for
+        the job, or None when it is unknown or has expired.
+        """
+        rows = self._connection().execute(
+            'SELECT part, value FROM jobs WHERE id = ? AND created > ?', (job_id, time.time() - self.ttl)
+        ).fetchall()
+        if not rows:
+            return None
+        job = {part: json.loads(value) if value is not None else None for part, value in rows}
+        job['state'] = DONE if all(value is not None for _, value in rows) else PENDING
+        return job
+
+    def watch(self, job_id, timeout=JOB_STREAM_TIMEOUT):
+        """
+        Yield (event, value) as the job progresses: (part, value) once for
+        every part as soon as it is done, then ('done', None). A job that
+        expires yields ('expired', None) and one still running after timeout
+        seconds ('timeout', None); (None, None) is yielded now and then while
+        nothing happens, for keep-alives.
+        """
+        sent = set()
+        start = last = time.monotonic()
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                yield 'expired', None
+                return
+            for part, value in job.items():
+                if part != 'state' and value is not None and part not in sent:
+                    sent.add(part)
+                    last = time.monotonic()
+                    yield part, value
+            if job['state'] == DONE:
+                yield 'done', None
+                return
+
+            now = time.monotonic()
+            if now - start >= timeout:
+                yield 'timeout', None
+                return
+            if now - last >= _KEEPALIVE_INTERVAL:
+                last = now
+                yield None, None
+            time.sleep(_WATCH_INTERVAL)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        entries = None
+        try:
+            entries = self._connection().execute('SELECT COUNT(DISTINCT id) FROM jobs').fetchone()[0]
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Job store read failed: %s", e)
+        return {
+            'path': self.path or None,
+            'jobs': entries,
+            'ttl': self.ttl,
+            'workers': self.workers,
+            'completed_parts': self.completed,
+            'failed_parts': self.failed,
+        }
+
+
+JOB_STORE = JobStore()
@@ -0,0 +1,70 @@
+"""
+Batch linearity checking in the budgeted sandbox.
+
+Every unique equation is admitted by its cost and checked in the sandbox
+lane for it (see admission.py), under the same CPU, memory and wall-time
+budget as a single check. Threads fan the batch out over the lanes; the
+lanes' worker processes do the symbolic work, so SymPy holding the GIL
+does not serialize it. Workers run is_linear_de through check_equation
+from linearity_checker.py, the same code the Flask app and the CLI script
+use.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import SLOW_LANE_WORKERS, admit
+from linearity_checker import check_equation
+from sandbox import SANDBOX_WORKERS
+
+# Threads feeding a batch to the sandbox; enough to keep both lanes busy
+BATCH_THREADS = max(1, SANDBOX_WORKERS + SLOW_LANE_WORKERS)
+
+# Upper bound on equations per batch request
+MAX_BATCH_SIZE = int(os.environ.get('LINEARITY_BATCH_MAX', 1000))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared thread pool, starting it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BATCH_THREADS, thread_name_prefix='linearity')
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _check_admitted(equation):
+    return check_equation(equation, admit)
+
+
+def check_linearity_batch(equations):
+    """
+    Check a list of equations and return one result per equation, in order.
+
+    Duplicate equations are checked once. Each result has the equation text,
+    status, is_linear (None when the equation could not be analyzed, was too
+    complex or ran over its budget) and message. An error in one item never
+    fails the batch.
+    """
+    if len(equations) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} equations can be checked at once.")
+
+    unique = list(dict.fromkeys(equations))
+    if len(unique) > 1:
+        checked = list(get_executor().map(_check_admitted, unique))
+    else:
+        checked = [_check_admitted(equation) for equation in unique]
+
+    by_equation = dict(zip(unique, checked))
+    return [dict(by_equation[equation], equation=equation) for equation in equations]
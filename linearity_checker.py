@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 import sys
 import json
-import re
-from sympy import symbols, Function, diff, sin, exp, parse_expr
+import logging
+from pattern_matcher import find_nonlinear_terms
+from parse_cache import cached_parse_equation, canonicalize
+from linearity_engine import analyze_linearity
+from serve import request_args, serve
+from verdict_store import VERDICT_STORE
+from admission import check_cost, estimate_cost
+
+logger = logging.getLogger(__name__)
 
 def is_linear_de(equation):
     """
@@ -16,173 +23,144 @@ def is_linear_de(equation):
     a₀(x)y + a₁(x)y' + a₂(x)y'' + ... + aₙ(x)y^(n) = f(x)
     
     Where all coefficients a₀(x), a₁(x), etc. are functions of x only (not involving y).
+    
+    Key properties that make an equation NON-linear include:
+    1. Any term with y or its derivatives raised to a power other than 1
+    2. Products of y or its derivatives (like y*y' or y'*y'')
+    3. Transcendental functions of y (like sin(y), e^y, etc.)
+    4. Rational expressions with y in the denominator
+    
+    This is the single implementation shared by this script, the Flask app
+    and the batch workers, so they always agree.
     """
+    logger.debug("Analyzing equation: %s", equation)
+    
     # STEP 1: Clean and normalize the equation
-    # Replace unicode prime symbols with standard notation
-    equation = equation.replace('′', "'")
+    # Canonical form: every unicode prime (′ ″ ‴ ⁗) becomes ASCII primes and
+    # '**' becomes '^', as the patterns and the gate below expect
+    equation = canonicalize(equation)
     
     # STEP 2: Direct pattern matching for obvious non-linear terms
     if _contains_nonlinear_patterns(equation):
         return False
         
     # STEP 3: Make sure it's actually a differential equation
-    if "y'" not in equation and "y′" not in equation:
+    if "y'" not in equation and "y^(" not in equation:
+        logger.debug("Not a differential equation: no derivatives found")
         return False
     
-    # STEP 4: Symbolic mathematical analysis (if pattern matching is inconclusive)
-    try:
-        if not _is_linear_symbolic_analysis(equation):
-            return False
-    except Exception:
-        # If symbolic analysis fails, we rely on the pattern matching already done
-        pass
-        
-    # If we get here and no non-linearity was detected, the equation is linear
-    return True
+    # STEP 4: Symbolic mathematical analysis (if pattern matching is inconclusive).
+    # An equation that does not parse raises: it has no verdict, so it is
+    # reported as an error and never stored as linear
+    return _is_linear_symbolic_analysis(equation)
+
+def stored_is_linear(equation, run=None):
+    """
+    is_linear_de through the persistent verdict store, so an equation checked
+    by any process on this node (or before a restart) is not analyzed again.
+    On a miss the check runs as run(is_linear_de, equation) when run is given
+    (e.g. in the budgeted sandbox).
+    """
+    compute = (lambda: run(is_linear_de, equation)) if run else (lambda: is_linear_de(equation))
+    return VERDICT_STORE.get_or_compute('linearity', (canonicalize(equation),), compute)
 
 def _contains_nonlinear_patterns(equation):
-    """Check if the equation contains obvious non-linear terms using pattern matching."""
-    # GROUP 1: Basic non-linear terms involving y itself
-    basic_nonlinear = [
-        "y**", "y^", "y*y",                # y raised to powers
-        "sin(y)", "cos(y)", "tan(y)",      # trigonometric functions of y
-        "exp(y)", "e^y", "e**y",           # exponential of y
-        "log(y)", "ln(y)",                 # logarithmic terms
-        "/y", "1/y",                       # rational expressions with y in denominator
-    ]
-    
-    # GROUP 2: Non-linear terms involving first derivative
-    first_derivative_nonlinear = [
-        "y'**", "y'^", "y'*y'",            # y' raised to powers
-        "sin(y')", "cos(y')", "tan(y')",   # trig functions of y'
-        "exp(y')", "e^y'", "e**y'",        # exponential of y'
-        "y*y'",                            # product of y and y'
-    ]
-    
-    # GROUP 3: Non-linear terms involving second derivative
-    second_derivative_nonlinear = [
-        "y''**", "y''^", "y''*y''",        # y'' raised to powers
-        "sin(y'')", "cos(y'')", "tan(y'')",# trig functions of y''
-        "exp(y'')", "e^y''", "e**y''",     # exponential of y''
-        "e^(y'')", "e**(y'')",             # alternative notation
-        "y*y''", "y'*y''",                 # products with y''
-    ]
-    
-    # GROUP 4: Non-linear terms involving third derivative
-    third_derivative_nonlinear = [
-        "y'''**", "y'''^", "y'''*y'''",    # y''' raised to powers
-        "sin(y''')", "e^y'''",             # functions of y'''
-        "y*y'''", "y'*y'''", "y''*y'''",   # products with y'''
-    ]
-    
-    # Combine all pattern groups
-    all_patterns = []
-    all_patterns.extend(basic_nonlinear)
-    all_patterns.extend(first_derivative_nonlinear)
-    all_patterns.extend(second_derivative_nonlinear)
-    all_patterns.extend(third_derivative_nonlinear)
-    
-    # Also check for patterns using unicode prime (′) instead of standard prime (')
-    unicode_patterns = [p.replace("'", "′") for p in all_patterns]
-    all_patterns.extend(unicode_patterns)
+    """
+    Check if the equation contains obvious non-linear terms using pattern matching.
     
-    # Check each pattern
-    for pattern in all_patterns:
-        if pattern in equation:
-            return True
-            
-    # No non-linear patterns found
-    return False
+    The pattern groups (powers, functions and products of y and its derivatives)
+    live in pattern_matcher.py and are compiled once at import into a single
+    automaton, so the equation is scanned in one pass.
+    """
+    hits = find_nonlinear_terms(equation)
+    for offset, pattern in hits:
+        logger.debug("Non-linear term detected: %s at offset %d", pattern, offset)
+    return bool(hits)
 
 def _is_linear_symbolic_analysis(equation):
-    """Analyze the equation using SymPy's symbolic mathematics to determine linearity."""
-    # Create symbolic variables and function
-    x = symbols('x')
-    y = Function('y')(x)
-    
-    # Normalize the equation to standard form: expression = 0
-    if '=' in equation:
-        lhs, rhs = equation.split('=', 1)
-        eq_str = f"({lhs.strip()}) - ({rhs.strip()})"
-    else:
-        eq_str = equation.strip()
-        
-    # Convert to SymPy syntax
-    eq_str = eq_str.replace("y'''", "Derivative(y(x), x, 3)")
-    eq_str = eq_str.replace("y''", "Derivative(y(x), x, 2)")
-    eq_str = eq_str.replace("y'", "Derivative(y(x), x)")
-    
-    # Replace standalone y with y(x) function notation
-    eq_str = re.sub(r'(?<![a-zA-Z0-9_])y(?![a-zA-Z0-9_\(])', 'y(x)', eq_str)
-    
-    # Replace power notation
-    eq_str = eq_str.replace('^', '**')
-    
-    # Parse the equation into a symbolic expression
-    expr = parse_expr(eq_str, local_dict={'y': y, 'x': x, 'Derivative': diff})
+    """
+    Analyze the equation using SymPy's symbolic mathematics to determine linearity.
     
-    # Create a list of y and all its derivatives to check
-    derivatives = [y]  # y itself
-    for i in range(1, 4):  # Add first, second, and third derivatives
-        derivatives.append(diff(y, x, i))
-        
-    # Check 1: No variable coefficient for derivatives
-    for deriv in derivatives:
-        if expr.has(deriv):
-            # Collect terms with respect to this derivative
-            collected = expr.collect(deriv)
-            
-            # Get the coefficient of the derivative
-            coeff = collected.coeff(deriv)
-            
-            # Check if coefficient contains y or any derivative
-            if any(str(d) in str(coeff) for d in derivatives):
-                return False
-                
-    # Check 2: No higher powers of derivatives
-    for deriv in derivatives:
-        # Check for terms like (y')² or y'·y'
-        if expr.has(deriv**2) or expr.has(deriv*deriv):
-            return False
-            
-    # Check 3: No transcendental functions applied to y or derivatives
-    for func in [sin, exp]:  # Check common functions
-        for deriv in derivatives:
-            if expr.has(func(deriv)):
-                return False
+    The equation is parsed (through the shared parse cache) into lhs - rhs and
+    handed to the structural engine in linearity_engine.py, which walks it once
+    treating y and all of its derivatives as generators.
+    """
+    expr = cached_parse_equation(equation)
     
-    # Equation passed all symbolic checks for linearity
+    # Walk the tree once: degree <= 1 in y and all of its derivatives, with
+    # coefficients free of them, and at least one derivative present
+    analysis = analyze_linearity(expr)
+    if not analysis['is_linear']:
+        logger.debug(analysis['reason'])
+        return False
+    if analysis['order'] == 0:
+        logger.debug("Not a differential equation: no derivatives of y remain")
+        return False
     return True
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({
-            'status': 'error',
-            'message': 'No equation provided'
-        }))
-        sys.exit(1)
+def check_equation(equation, admit=None):
+    """
+    Check one equation and return the JSON result for it.
     
-    equation = sys.argv[1]
+    With admit (admission.admit) the equation is admitted by its cost and
+    analyzed in the budgeted sandbox lane it returns; without it the cost is
+    only checked against the ceilings and the analysis runs here.
     
+    Never raises: an error analyzing the equation, or one that ran over its
+    budget, becomes an error result, so one bad item cannot fail a batch.
+    """
     try:
-        if is_linear_de(equation):
-            result = {
+        # Over-complex input is an error result before it is parsed
+        if admit is not None:
+            run = admit(equation).run
+        else:
+            check_cost(estimate_cost(equation))
+            run = None
+        if stored_is_linear(equation, run):
+            return {
                 'status': 'success',
+                'is_linear': True,
                 'message': f"The differential equation '{equation}' is linear."
             }
-        else:
-            result = {
-                'status': 'error',
-                'message': f"The differential equation '{equation}' is not linear."
-            }
-        
-        print(json.dumps(result))
+        return {
+            'status': 'error',
+            'is_linear': False,
+            'message': f"The differential equation '{equation}' is not linear."
+        }
     except Exception as e:
-        print(json.dumps({
+        return {
             'status': 'error',
+            'is_linear': None,
             'message': f"Error analyzing equation: {str(e)}"
-        }))
+        }
+
+def respond(args):
+    """
+    Return (response, ok) for the script's arguments; ok is False when the
+    one-shot script should exit with an error status.
+    """
+    if len(args) < 1:
+        return {
+            'status': 'error',
+            'message': 'No equation provided'
+        }, False
+    
+    result = check_equation(args[0])
+    return {'status': result['status'], 'message': result['message']}, result['is_linear'] is not None
+
+def handle_request(request):
+    """Answer one --serve request: {"equation": ...} or {"args": [...]}"""
+    return respond(request_args(request, ('equation',)))
+
+def main():
+    if '--serve' in sys.argv[1:]:
+        serve(handle_request)
+        return
+    
+    response, ok = respond(sys.argv[1:])
+    print(json.dumps(response))
+    if not ok:
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+"""
+Structural linearity test for parsed differential equations.
+
+The expression tree is walked once. y(x) and every Derivative(y(x), (x, n))
+are treated as generators, and each subtree is reduced to a linear form
+
+    a0*y + a1*y' + ... + an*y^(n) + b
+
+whose coefficients must be free of the generators. Any product of two
+generator-bearing factors, power of one, or function applied to one makes the
+equation non-linear, and the walk stops at the first such node. Derivatives of
+any order are handled the same way, and the order and coefficients fall out of
+the same pass.
+"""
+from sympy import Add, Derivative, Mul, Pow, S
+
+from ode_parser import X, Y
+
+
+class _NonLinear(Exception):
+    """Raised inside the walk to unwind as soon as a non-linear node is found."""
+
+
+def _derivative_order(node, yx, x):
+    """Return n if node is y(x) or Derivative(y(x), (x, n)), otherwise None."""
+    if node == yx:
+        return 0
+    if isinstance(node, Derivative) and node.expr == yx:
+        order = 0
+        for var, count in node.variable_count:
+            if var != x:
+                return None
+            order += count
+        return order
+    return None
+
+
+def _linear_form(node, yx, x):
+    """
+    Reduce node to (coefficients, constant).
+
+    coefficients maps derivative order to its coefficient and is empty when the
+    node does not involve y at all, in which case constant is the node itself.
+    """
+    order = _derivative_order(node, yx, x)
+    if order is not None:
+        return {order: S.One}, S.Zero
+
+    if node.is_Atom:
+        return {}, node
+
+    if isinstance(node, Add):
+        coefficients = {}
+        constants = []
+        for arg in node.args:
+            arg_coeffs, arg_const = _linear_form(arg, yx, x)
+            for k, c in arg_coeffs.items():
+                coefficients.setdefault(k, []).append(c)
+            if arg_const is not S.Zero:
+                constants.append(arg_const)
+        if not coefficients:
+            return {}, node
+        return (
+            {k: Add(*terms) for k, terms in coefficients.items()},
+            Add(*constants),
+        )
+
+    if isinstance(node, Mul):
+        linear = None
+        factors = []
+        for arg in node.args:
+            arg_coeffs, arg_const = _linear_form(arg, yx, x)
+            if arg_coeffs:
+                if linear is not None:
+                    raise _NonLinear(f"product of {linear[2]} and {arg}")
+                linear = (arg_coeffs, arg_const, arg)
+            else:
+                factors.append(arg)
+        if linear is None:
+            return {}, node
+        scale = Mul(*factors)
+        arg_coeffs, arg_const, _ = linear
+        return (
+            {k: scale * c for k, c in arg_coeffs.items()},
+            scale * arg_const,
+        )
+
+    if isinstance(node, Pow):
+        base_coeffs, _ = _linear_form(node.base, yx, x)
+        exp_coeffs, _ = _linear_form(node.exp, yx, x)
+        if base_coeffs or exp_coeffs:
+            raise _NonLinear(f"power {node}")
+        return {}, node
+
+    if isinstance(node, Derivative):
+        # A derivative of something other than y itself, e.g. (x*y)'
+        if node.has(yx):
+            return _linear_form(node.doit(), yx, x)
+        return {}, node
+
+    # Any other function application: sin(y), log(y'), tanh(y''''), ...
+    for arg in node.args:
+        arg_coeffs, _ = _linear_form(arg, yx, x)
+        if arg_coeffs:
+            raise _NonLinear(f"{node.func} applied to {arg}")
+    return {}, node
+
+
+def analyze_linearity(expr, x=X, y=Y):
+    """
+    Decide whether expr = 0 is a linear differential equation in y(x).
+
+    Returns a dict with:
+    - is_linear: whether expr is of degree <= 1 in y and its derivatives
+    - order: the highest derivative order present (None if non-linear)
+    - coefficients: {order: coefficient} of each y^(order) term
+    - forcing: f(x) such that sum(coefficients[k] * y^(k)) = f(x)
+    - reason: why the equation is non-linear, otherwise None
+    """
+    yx = y(x)
+    try:
+        coefficients, constant = _linear_form(expr, yx, x)
+    except _NonLinear as e:
+        return {
+            'is_linear': False,
+            'order': None,
+            'coefficients': {},
+            'forcing': None,
+            'reason': f"Non-linear term: {e}",
+        }
+
+    coefficients = {k: c for k, c in coefficients.items() if c != 0}
+    return {
+        'is_linear': True,
+        'order': max(coefficients) if coefficients else 0,
+        'coefficients': dict(sorted(coefficients.items())),
+        'forcing': -constant,
+        'reason': None,
+    }
@@ -0,0 +1,131 @@
+"""
+Differential equations in explicit form, compiled for numerical work.
+
+An equation of order n is solved for its highest derivative,
+
+    y^(n) = f(x, y, y', ..., y^(n-1)),
+
+which is the first-order system u0' = u1, ..., u(n-1)' = f(x, u0, ..., u(n-1))
+that slope fields and numerical solvers work from. The right-hand side is
+lambdified once per equation and the compiled form is kept in a bounded
+cache, so repeated requests for the same equation only evaluate it.
+"""
+import os
+import sys
+
+import numpy as np
+from sympy import Derivative, Dummy, preorder_traversal, solve
+from sympy.utilities.lambdify import lambdify
+
+from ode_parser import X, Y
+from parse_cache import NODE_BYTES, ParseCache, cached_parse_equation, canonicalize
+from verification import derivative_orders, real_array
+
+# Highest derivative order reduced to a system
+MAX_ORDER = 4
+
+# Symbols other than x and y are given this value, as in plots
+CONSTANT_VALUE = 1
+
+
+class ExplicitFormError(ValueError):
+    """An equation that cannot be written as y^(n) = f(x, y, ..., y^(n-1))."""
+
+
+class ExplicitODE:
+    """
+    y^(n) = rhs, with rhs in terms of x and the state symbols y0 (y), y1
+    (y'), ..., y(n-1), Dummy symbols that never clash with constants of the
+    same name.
+
+    evaluate(x, *state) broadcasts over NumPy arrays and returns real floats,
+    NaN wherever the right-hand side is undefined.
+    """
+
+    def __init__(self, rhs, order, state, constants, x=X):
+        self.rhs = rhs
+        self.order = order
+        self.state = state
+        self.constants = constants
+        self.x = x
+        self.func = lambdify([x] + state, rhs, modules='numpy')
+
+    def evaluate(self, x, *state):
+        shape = np.broadcast(x, *state).shape
+        with np.errstate(all='ignore'):
+            return real_array(self.func(x, *state), shape)
+
+    def system(self, x, u):
+        """
+        Right-hand side of the first-order system for states u of shape
+        (order, ...): returns du/dx with the same shape.
+        """
+        return np.concatenate((u[1:], self.evaluate(x, *u)[np.newaxis]), axis=0)
+
+
+def explicit_form(de_expr, x=X, y=Y):
+    """
+    Solve a parsed equation for its highest derivative.
+
+    Returns (rhs, order, state symbols, names of other constants), with the
+    other constants already replaced by CONSTANT_VALUE. Raises
+    ExplicitFormError when the equation has no derivative, is of too high an
+    order, or does not determine the highest derivative uniquely.
+    """
+    orders = derivative_orders(de_expr, x, y)
+    order = max(orders, default=0)
+    if order == 0:
+        raise ExplicitFormError("The equation contains no derivative of y.")
+    if order > MAX_ORDER:
+        raise ExplicitFormError(f"Equations of order above {MAX_ORDER} are not supported.")
+
+    yx = y(x)
+    # Dummy, so user constants named y0, y1, ... stay distinct
+    state = [Dummy(f'y{k}') for k in range(order)]
+    highest = Dummy(f'y{order}')
+    replacements = {Derivative(yx, (x, k)): state[k] for k in range(1, order)}
+    replacements[yx] = state[0]
+    replacements[Derivative(yx, (x, order))] = highest
+    residual = de_expr.xreplace(replacements)
+
+    constants = sorted(residual.free_symbols - {x, highest} - set(state), key=lambda s: s.name)
+    residual = residual.xreplace({c: CONSTANT_VALUE for c in constants})
+
+    try:
+        solutions = solve(residual, highest)
+    except NotImplementedError:
+        solutions = []
+    primes = "'" * order
+    if len(solutions) != 1:
+        raise ExplicitFormError(
+            f"Could not write the equation as y{primes} = f(...): "
+            f"{'no' if not solutions else len(solutions)} solutions for y{primes}."
+        )
+    return solutions[0], order, state, [c.name for c in constants]
+
+
+def _ode_size(key, ode):
+    nodes = sum(1 for _ in preorder_traversal(ode.rhs))
+    return sys.getsizeof(key[1]) + nodes * NODE_BYTES
+
+
+# Compiled equations keyed on the canonical equation text
+ODE_CACHE = ParseCache(
+    max_entries=int(os.environ.get('ODE_CACHE_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('ODE_CACHE_BYTES', 8 * 1024 * 1024)),
+    sizeof=_ode_size,
+)
+
+
+def compile_ode(equation):
+    """
+    Parse, solve and compile an equation, through the cache.
+
+    Raises ExplicitFormError for equations that cannot be put in explicit
+    form, and the parser's error for input that does not parse.
+    """
+    def build():
+        rhs, order, state, constants = explicit_form(cached_parse_equation(equation))
+        return ExplicitODE(rhs, order, state, constants)
+
+    return ODE_CACHE.get_or_build(('ode', canonicalize(equation)), build)
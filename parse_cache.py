@@ -0,0 +1,152 @@
+"""
+Shared, bounded cache of parsed equations and solutions.
+
+The same inputs (the examples on the index page, homework sets) arrive over
+and over, so the linearity checker, the solution verifier and the plotter all
+go through this cache instead of parsing from scratch. Entries are keyed on a
+canonical form of the input text and evicted least-recently-used once either
+the entry count or the estimated memory footprint exceeds its limit.
+"""
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from sympy import preorder_traversal
+
+from ode_parser import parse_equation, parse_expression
+
+# Rough per-node footprint of a SymPy expression tree, used to estimate memory
+NODE_BYTES = 256
+
+_PRIME_FORMS = (('⁗', "''''"), ('‴', "'''"), ('″', "''"), ('′', "'"))
+# Whitespace between two word characters (group 1) or anywhere else
+_WHITESPACE_RE = re.compile(r'(?<=\w)(\s+)(?=\w)|\s+')
+
+
+def canonicalize(text):
+    """
+    Return the canonical form of an input used as the cache key.
+
+    Whitespace is dropped (a run between two word characters is kept as a
+    single space so '2 x' and 'sin x' keep their meaning), unicode primes
+    become ASCII primes and '**' becomes '^'.
+    """
+    text = _WHITESPACE_RE.sub(lambda m: ' ' if m.group(1) else '', text.strip())
+    for unicode_prime, ascii_primes in _PRIME_FORMS:
+        text = text.replace(unicode_prime, ascii_primes)
+    return text.replace('**', '^')
+
+
+def estimate_size(key, expr):
+    """Estimate the memory held by one cache entry in bytes."""
+    nodes = sum(1 for _ in preorder_traversal(expr))
+    return sys.getsizeof(key[1]) + nodes * NODE_BYTES
+
+
+class ParseCache:
+    """
+    Thread-safe LRU cache with both an entry-count and a byte budget.
+
+    Parsing happens outside the lock, so two threads that miss on the same
+    key at once may both parse it; the first result stored wins.
+
+    sizeof(key, value) estimates an entry's footprint; the default suits
+    SymPy expressions.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, sizeof=estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key, build):
+        """Return the cached value for key, calling build() on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = build()
+        size = self.sizeof(key, value)
+        if size > self.max_bytes:
+            # Never let one huge input flush the whole cache
+            return value
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def merge_stats(stats):
+    """
+    Combine ParseCache.stats() of one cache kept in several processes (such
+    as the sandbox workers): the counters and the occupancy add up, the
+    limits are those of a single process.
+    """
+    merged = {'entries': 0, 'bytes': 0, 'max_entries': None, 'max_bytes': None,
+              'hits': 0, 'misses': 0, 'evictions': 0}
+    for one in stats:
+        for field in ('entries', 'bytes', 'hits', 'misses', 'evictions'):
+            merged[field] += one[field]
+        merged['max_entries'] = one['max_entries']
+        merged['max_bytes'] = one['max_bytes']
+    lookups = merged['hits'] + merged['misses']
+    merged['hit_rate'] = merged['hits'] / lookups if lookups else 0.0
+    return merged
+
+
+PARSE_CACHE = ParseCache(
+    max_entries=int(os.environ.get('PARSE_CACHE_ENTRIES', 1024)),
+    max_bytes=int(os.environ.get('PARSE_CACHE_BYTES', 16 * 1024 * 1024)),
+)
+
+
+def cached_parse_equation(text):
+    """parse_equation() through the shared cache."""
+    key = ('equation', canonicalize(text))
+    return PARSE_CACHE.get_or_build(key, lambda: parse_equation(key[1]))
+
+
+def cached_parse_expression(text):
+    """parse_expression() through the shared cache."""
+    key = ('expression', canonicalize(text))
+    return PARSE_CACHE.get_or_build(key, lambda: parse_expression(key[1]))
@@ -0,0 +1,146 @@
+"""
+Compiled multi-pattern matching for the linearity pre-check.
+
+The non-linear pattern table is compiled once at import into an Aho-Corasick
+automaton, so scanning an equation costs a single pass over its characters no
+matter how many patterns are registered.
+"""
+import re
+
+# GROUP 1: Basic non-linear terms involving y itself
+BASIC_NONLINEAR = (
+    "y**", "y^", "y*y",                # y raised to powers
+    "sin(y)", "cos(y)", "tan(y)",      # trigonometric functions of y
+    "exp(y)", "e^y", "e**y",           # exponential of y
+    "log(y)", "ln(y)",                 # logarithmic terms
+    "/y", "1/y",                       # rational expressions with y in denominator
+)
+
+# GROUP 2: Non-linear terms involving first derivative
+FIRST_DERIVATIVE_NONLINEAR = (
+    "y'**", "y'^", "y'*y'",            # y' raised to powers
+    "sin(y')", "cos(y')", "tan(y')",   # trig functions of y'
+    "exp(y')", "e^y'", "e**y'",        # exponential of y'
+    "y*y'",                            # product of y and y'
+)
+
+# GROUP 3: Non-linear terms involving second derivative
+SECOND_DERIVATIVE_NONLINEAR = (
+    "y''**", "y''^", "y''*y''",        # y'' raised to powers
+    "sin(y'')", "cos(y'')", "tan(y'')",# trig functions of y''
+    "exp(y'')", "e^y''", "e**y''",     # exponential of y''
+    "e^(y'')", "e**(y'')",             # alternative notation
+    "y*y''", "y'*y''",                 # products with y''
+)
+
+# GROUP 4: Non-linear terms involving third derivative
+THIRD_DERIVATIVE_NONLINEAR = (
+    "y'''**", "y'''^", "y'''*y'''",    # y''' raised to powers
+    "sin(y''')", "e^y'''",             # functions of y'''
+    "y*y'''", "y'*y'''", "y''*y'''",   # products with y'''
+)
+
+_ASCII_PATTERNS = (
+    BASIC_NONLINEAR
+    + FIRST_DERIVATIVE_NONLINEAR
+    + SECOND_DERIVATIVE_NONLINEAR
+    + THIRD_DERIVATIVE_NONLINEAR
+)
+
+# Also match the same patterns written with the unicode prime (′)
+NONLINEAR_PATTERNS = _ASCII_PATTERNS + tuple(p.replace("'", "′") for p in _ASCII_PATTERNS)
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a fixed set of literal patterns.
+
+    The failure links are folded into a full transition table at build time,
+    so a scan is one dictionary lookup per input character plus the cost of
+    reporting hits.
+    """
+
+    def __init__(self, patterns):
+        # Drop duplicates but keep the declaration order
+        self.patterns = tuple(dict.fromkeys(p for p in patterns if p))
+
+        goto = [{}]
+        outputs = [[]]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(index)
+
+        # Breadth-first pass: compute failure links and the complete transition
+        # table. Transitions that fall back to the root are left out so each
+        # state only stores the edges that make progress.
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            fallback = delta[fail[state]]
+            transitions = dict(fallback)
+            for ch, nxt in goto[state].items():
+                transitions[ch] = nxt
+                fail[nxt] = fallback.get(ch, 0)
+                queue.append(nxt)
+            delta[state] = transitions
+            outputs[state] = outputs[state] + outputs[fail[state]]
+
+        self._delta = delta
+        self._outputs = [tuple(self.patterns[i] for i in out) for out in outputs]
+
+    def find_all(self, text):
+        """
+        Scan text once and return every (offset, pattern) hit.
+
+        Hits are ordered by the position where they end; overlapping and nested
+        matches are all reported.
+        """
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        hits = []
+        for end, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                for pattern in outputs[state]:
+                    hits.append((end - len(pattern) + 1, pattern))
+        return hits
+
+    def search(self, text):
+        """Return the first (offset, pattern) hit in text, or None."""
+        delta = self._delta
+        outputs = self._outputs
+        state = 0
+        for end, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                pattern = outputs[state][0]
+                return end - len(pattern) + 1, pattern
+        return None
+
+
+# Built once at import and shared by every request
+NONLINEAR_MATCHER = AhoCorasick(NONLINEAR_PATTERNS)
+
+# y^(n) is derivative notation, not a power of y
+_DERIVATIVE_ORDER_RE = re.compile(r'\(\s*\d+\s*\)')
+
+
+def find_nonlinear_terms(equation):
+    """Return every (offset, pattern) non-linear hit in the equation."""
+    return [
+        (offset, pattern) for offset, pattern in NONLINEAR_MATCHER.find_all(equation)
+        if not (pattern == "y^" and _DERIVATIVE_ORDER_RE.match(equation, offset + 2))
+    ]
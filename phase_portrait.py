@@ -0,0 +1,135 @@
+"""
+Phase portraits of autonomous second-order equations y'' = f(y, y').
+
+The (y, y') plane is covered by the vector field (y', f(y, y')), evaluated on
+the whole grid in one NumPy call, and a batch of trajectories integrated
+together by ivp_solver. The compiled right-hand side is cached per equation
+(see ode_system) and the trajectories per equation and starting points in the
+calling process, so panning or zooming a portrait with the same starting
+points only evaluates the new grid, whichever sandbox worker does it.
+"""
+import os
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from ivp_solver import solve_ivp
+from ode_system import ExplicitFormError, compile_ode
+from parse_cache import ParseCache, canonicalize
+from plot_data import encode_array
+
+# Default view, grid and trajectories
+PHASE_RANGE = (-5.0, 5.0)
+PHASE_GRID = (25, 25)
+MAX_PHASE_CELLS = 40000
+PHASE_STARTS = (4, 3)
+MAX_PHASE_TRAJECTORIES = 100
+
+# Trajectories are integrated this far forwards and backwards from each start
+PHASE_DURATION = 10.0
+PHASE_POINTS = 401
+
+# y: (ny,); v: (nv,) the y' values; dy, dv: (nv, ny) the field
+PhaseField = namedtuple('PhaseField', 'y v dy dv')
+
+
+def _check_autonomous(ode):
+    if ode.order != 2 or ode.x in ode.rhs.free_symbols:
+        raise ExplicitFormError("Phase portraits need an autonomous second-order equation y'' = f(y, y').")
+
+
+def phase_field(ode, y_range=PHASE_RANGE, v_range=PHASE_RANGE, ny=PHASE_GRID[0], nv=PHASE_GRID[1]):
+    """Evaluate the vector field (y', y'') of an ExplicitODE on an ny by nv grid."""
+    _check_autonomous(ode)
+    y = np.linspace(y_range[0], y_range[1], ny)
+    v = np.linspace(v_range[0], v_range[1], nv)
+    dv = ode.evaluate(0.0, y[np.newaxis, :], v[:, np.newaxis])
+    dy = np.broadcast_to(v[:, np.newaxis], dv.shape)
+    return PhaseField(y, v, np.where(np.isfinite(dv), dy, np.nan), dv)
+
+
+def default_starts(y_range, v_range, counts=PHASE_STARTS):
+    """Starting points (y, y') on a grid inset in the view."""
+    inset = [np.linspace(lo, hi, count + 2)[1:-1] for (lo, hi), count in zip((y_range, v_range), counts)]
+    grid = np.meshgrid(*inset, indexing='ij')
+    return np.column_stack([axis.ravel() for axis in grid])
+
+
+def _trajectories_size(key, trajectories):
+    return sys.getsizeof(key[1]) + trajectories.states.nbytes + trajectories.x.nbytes
+
+
+# Trajectories keyed on the canonical equation, the starting points and the
+# duration
+TRAJECTORY_CACHE = ParseCache(
+    max_entries=int(os.environ.get('TRAJECTORY_CACHE_ENTRIES', 128)),
+    max_bytes=int(os.environ.get('TRAJECTORY_CACHE_BYTES', 32 * 1024 * 1024)),
+    sizeof=_trajectories_size,
+)
+
+
+def phase_trajectories(ode, starts, duration=PHASE_DURATION, points=PHASE_POINTS):
+    """
+    Integrate trajectories through the (y, y') starting points, forwards and
+    backwards in x. Returns Trajectories.
+    """
+    _check_autonomous(ode)
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    return solve_ivp(ode, 0.0, starts, (-duration, duration), points)
+
+
+def equation_phase_field(equation, y_range, v_range, ny, nv):
+    """Compile the equation and return (names of its other constants, PhaseField)."""
+    ode = compile_ode(equation)
+    return ode.constants, phase_field(ode, y_range, v_range, ny, nv)
+
+
+def equation_trajectories(equation, starts, duration=PHASE_DURATION, points=PHASE_POINTS):
+    """Compile the equation and integrate trajectories through the starts."""
+    return phase_trajectories(compile_ode(equation), starts, duration, points)
+
+
+def _run_here(func, *args):
+    return func(*args)
+
+
+def equation_phase_portrait(equation, y_range, v_range, ny, nv, starts, run=None):
+    """
+    Return (names of the equation's other constants, PhaseField,
+    Trajectories), with the trajectories through the cache of the calling
+    process. The field, and the trajectories on a miss, are computed as
+    run(func, *args) when run is given (e.g. in the budgeted sandbox).
+    """
+    run = run or _run_here
+    constants, field = run(equation_phase_field, equation, y_range, v_range, ny, nv)
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    key = ('phase', canonicalize(equation), tuple(map(tuple, starts.tolist())), PHASE_DURATION, PHASE_POINTS)
+    trajectories = TRAJECTORY_CACHE.get_or_build(key, lambda: run(equation_trajectories, equation, starts))
+    return constants, field, trajectories
+
+
+def portrait_payload(field, trajectories):
+    """
+    Return a phase portrait as JSON-ready data: the grid, the field row by
+    row, and every trajectory's y and y' one after the other, as base64
+    float32 arrays.
+    """
+    return {
+        'ny': int(field.y.size),
+        'nv': int(field.v.size),
+        'dtype': 'float32',
+        'byte_order': 'little',
+        'y': encode_array(field.y),
+        'v': encode_array(field.v),
+        'dy': encode_array(field.dy),
+        'dv': encode_array(field.dv),
+        'trajectories': {
+            'count': int(trajectories.states.shape[1]),
+            'points': int(trajectories.x.size),
+            't': encode_array(trajectories.x),
+            'y': encode_array(trajectories.states[0]),
+            'v': encode_array(trajectories.states[1]),
+            'status': trajectories.status,
+        },
+    }
@@ -0,0 +1,265 @@
+"""
+Sampled solution curves, independent of matplotlib.
+
+Sampling a solution (parsing, compiling, adaptive sampling and singularity
+detection) is separate from drawing it, so clients that draw plots
+themselves can be given the numbers without the server rendering anything.
+The samples are sent as little-endian float32 arrays, either base64-encoded
+inside JSON or as the raw bytes of an application/octet-stream body.
+"""
+import base64
+import math
+import os
+import re
+import sys
+from collections import namedtuple
+
+import numpy as np
+from sympy.utilities.lambdify import lambdify
+
+from ode_parser import X
+from parse_cache import ParseCache, cached_parse_expression, canonicalize
+from plot_sampling import adaptive_sample, find_singularities, split_segments
+from plot_store import PLOT_RANGE
+from verification import real_array
+
+# Values beyond this are left out of the plot
+Y_LIMIT = 10
+
+# Wire format of sampled arrays
+DATA_DTYPE = np.dtype('<f4')
+
+CurveData = namedtuple('CurveData', 'x y singularities segments')
+
+# Integration constants: C, C1, C2, ...; a single curve is plotted with
+# every one of them set to 1
+CONSTANT_RE = re.compile(r'^C\d*$')
+
+# Family plots: how many members by default and at most, the values the
+# constants range over and the uniform grid every member is evaluated on
+FAMILY_MEMBERS = 20
+MAX_FAMILY_MEMBERS = 100
+FAMILY_SPAN = (-2.0, 2.0)
+FAMILY_POINTS = 500
+
+# x: (points,); y: (members, points); values: (members, constants)
+FamilyData = namedtuple('FamilyData', 'x y constants values')
+
+
+class PlotError(ValueError):
+    """
+    A solution that cannot be plotted.
+
+    code is one of 'parse_error', 'compile_error', 'evaluation_error' or
+    'render_error'; message is the human-readable explanation.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+    def __reduce__(self):
+        # Pickle with both arguments, so it can be raised in a sandbox worker
+        return (PlotError, (self.code, self.message))
+
+    def to_dict(self):
+        return {'code': self.code, 'message': self.message}
+
+
+def _curve_size(key, curve):
+    # Curves and families share the cache
+    extra = curve.values.nbytes if isinstance(curve, FamilyData) else 64 * len(curve.singularities)
+    return sys.getsizeof(key[1]) + curve.x.nbytes + curve.y.nbytes + extra
+
+
+# Sampled curves keyed on the canonical solution and range; sampling and
+# singularity detection are skipped for a solution seen before
+CURVE_CACHE = ParseCache(
+    max_entries=int(os.environ.get('CURVE_CACHE_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('CURVE_CACHE_BYTES', 16 * 1024 * 1024)),
+    sizeof=_curve_size,
+)
+
+
+def solution_expression(solution):
+    """Return the text after 'y = ', or the whole text if there is none."""
+    if "y = " in solution:
+        return solution.split("y = ")[1]
+    return solution
+
+
+def _sample_curve(y_sym, y_expr):
+    # Create a numerical function from symbolic expression
+    try:
+        y_func = lambdify(X, y_sym, modules=['numpy'])
+    except Exception as e:
+        raise PlotError('compile_error', f"Could not create plot function: {str(e)}")
+
+    try:
+        # Sample adaptively: dense where the curve bends, sparse where it is
+        # straight; NaN wherever it is not finite or not real
+        x, y = adaptive_sample(y_func, PLOT_RANGE[0], PLOT_RANGE[1], Y_LIMIT)
+        if not np.isfinite(y).any():
+            raise PlotError('evaluation_error', "No valid points to plot - function may have singularities everywhere in this range")
+        singularities = find_singularities(y_func, x, y, Y_LIMIT)
+    except PlotError:
+        raise
+    except Exception as e:
+        raise PlotError('evaluation_error', f"Could not plot: {y_expr}. Error: {str(e)}")
+
+    return CurveData(x, y, singularities, split_segments(x, y, singularities))
+
+
+def sample_curve(solution):
+    """
+    Sample a solution over the plot range, without the curve cache.
+
+    Returns CurveData: the sample points, the values (NaN where undefined),
+    the singularities found and the [start, stop) index ranges of the
+    continuous pieces between them. Raises PlotError when the solution
+    cannot be parsed, compiled or evaluated.
+    """
+    y_expr = solution_expression(solution)
+
+    # Parse the solution through the shared cache and fill in the constants
+    try:
+        y_sym = cached_parse_expression(y_expr)
+        y_sym = y_sym.xreplace({constant: 1 for constant in integration_constants(y_sym)})
+    except Exception as e:
+        raise PlotError('parse_error', f"Could not parse: {y_expr}. Error: {str(e)}")
+
+    return _sample_curve(y_sym, y_expr)
+
+
+def sample_solution(solution, run=None):
+    """
+    sample_curve through the curve cache of the calling process. On a miss
+    the curve is sampled as run(sample_curve, solution) when run is given
+    (e.g. in the budgeted sandbox), so the cache is shared by every sandbox
+    worker and outlives them.
+    """
+    key = ('curve', canonicalize(solution_expression(solution)), PLOT_RANGE)
+    compute = (lambda: run(sample_curve, solution)) if run else (lambda: sample_curve(solution))
+    return CURVE_CACHE.get_or_build(key, compute)
+
+
+def constant_grid(count, members):
+    """
+    Return a (members', count) array of constant values covering FAMILY_SPAN,
+    a full grid with the same number of values per constant and at most
+    members rows (one empty row when there are no constants).
+    """
+    if not count:
+        return np.zeros((1, 0))
+    per_constant = max(int(math.floor(members ** (1.0 / count) + 1e-9)), 1)
+    axis = np.linspace(FAMILY_SPAN[0], FAMILY_SPAN[1], per_constant) if per_constant > 1 else np.zeros(1)
+    grids = np.meshgrid(*([axis] * count), indexing='ij')
+    return np.stack([grid.ravel() for grid in grids], axis=1)
+
+
+def integration_constants(y_sym):
+    """Return the integration constants of an expression, sorted by name."""
+    return sorted((s for s in y_sym.free_symbols if CONSTANT_RE.match(s.name)), key=lambda s: s.name)
+
+
+def _sample_family(y_sym, y_expr, members):
+    constants = integration_constants(y_sym)
+    try:
+        y_func = lambdify([X] + constants, y_sym, modules=['numpy'])
+    except Exception as e:
+        raise PlotError('compile_error', f"Could not create plot function: {str(e)}")
+
+    x = np.linspace(PLOT_RANGE[0], PLOT_RANGE[1], FAMILY_POINTS)
+    values = constant_grid(len(constants), members)
+    try:
+        # One broadcast call: x along the columns, each constant down the rows
+        with np.errstate(all='ignore'):
+            y = real_array(y_func(x[np.newaxis, :], *values.T[:, :, np.newaxis]),
+                           (values.shape[0], x.size))
+    except Exception as e:
+        raise PlotError('evaluation_error', f"Could not plot: {y_expr}. Error: {str(e)}")
+    if not np.isfinite(y).any():
+        raise PlotError('evaluation_error', "No valid points to plot - function may have singularities everywhere in this range")
+
+    return FamilyData(x, y, [c.name for c in constants], values)
+
+
+def sample_family_curves(solution, members=FAMILY_MEMBERS):
+    """
+    Sample a whole solution family over the plot range, without the curve
+    cache.
+
+    The solution is compiled once as a function of x and its integration
+    constants, and every member is evaluated in one broadcast numpy call over
+    a grid of constant values. Returns FamilyData; raises PlotError like
+    sample_curve.
+    """
+    y_expr = solution_expression(solution)
+    try:
+        y_sym = cached_parse_expression(y_expr)
+    except Exception as e:
+        raise PlotError('parse_error', f"Could not parse: {y_expr}. Error: {str(e)}")
+
+    return _sample_family(y_sym, y_expr, members)
+
+
+def sample_family(solution, members=FAMILY_MEMBERS, run=None):
+    """
+    sample_family_curves through the curve cache of the calling process,
+    run like sample_solution.
+    """
+    key = ('family', canonicalize(solution_expression(solution)), PLOT_RANGE, members)
+    compute = ((lambda: run(sample_family_curves, solution, members)) if run
+               else (lambda: sample_family_curves(solution, members)))
+    return CURVE_CACHE.get_or_build(key, compute)
+
+
+def family_payload(family):
+    """
+    Return a sampled family as JSON-ready data: x as one float32 array, y as
+    all members' values one after the other, and the constants of each member.
+    """
+    return {
+        'points': int(family.x.size),
+        'members': int(family.y.shape[0]),
+        'dtype': 'float32',
+        'byte_order': 'little',
+        'x_range': list(PLOT_RANGE),
+        'y_limit': Y_LIMIT,
+        'constants': family.constants,
+        'values': family.values.tolist(),
+        'x': encode_array(family.x),
+        'y': encode_array(family.y),
+    }
+
+
+def encode_array(values):
+    """Return an array as base64 of its little-endian float32 bytes."""
+    return base64.b64encode(np.ascontiguousarray(values, dtype=DATA_DTYPE).tobytes()).decode('ascii')
+
+
+def curve_metadata(curve):
+    """Describe a sampled curve, without the sample arrays."""
+    return {
+        'points': int(curve.x.size),
+        'dtype': 'float32',
+        'byte_order': 'little',
+        'x_range': list(PLOT_RANGE),
+        'y_limit': Y_LIMIT,
+        'segments': [list(segment) for segment in curve.segments],
+        'singularities': curve.singularities,
+    }
+
+
+def curve_bytes(curve):
+    """Return the samples as raw float32: all x values, then all y values."""
+    return curve.x.astype(DATA_DTYPE).tobytes() + curve.y.astype(DATA_DTYPE).tobytes()
+
+
+def curve_payload(curve):
+    """Return the sampled curve as JSON-ready data with base64 float32 arrays."""
+    payload = curve_metadata(curve)
+    payload['x'] = encode_array(curve.x)
+    payload['y'] = encode_array(curve.y)
+    return payload
@@ -0,0 +1,325 @@
+"""
+Solution plots rendered with matplotlib's object-oriented API.
+
+Instead of driving the global pyplot state machine, every thread keeps its
+own Figure on an Agg canvas with the axes, grid, zero lines and labels
+already laid out. A request only swaps in the curve data and the texts and
+prints the canvas to PNG. The figures are never registered with pyplot, so
+nothing leaks when a request fails half-way; the next render resets every
+piece of per-request state anyway.
+"""
+import io
+import os
+import threading
+
+import numpy as np
+
+# Conditionally import matplotlib only when needed
+try:
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+    MATPLOTLIB_AVAILABLE = True
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+from plot_data import FAMILY_SPAN, Y_LIMIT, PlotError
+
+FIGSIZE = (8, 5)
+DPI = 100
+
+# At most this many singularities are marked, to avoid clutter
+MAX_SINGULARITY_MARKERS = 3
+
+LAYOUT_RECT = [0, 0.03, 1, 0.95]
+
+
+class SolutionPlotTemplate:
+    """A solution plot whose curve, markers and texts are replaced per render."""
+
+    def __init__(self):
+        self.figure = Figure(figsize=FIGSIZE, dpi=DPI)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.axes = self.figure.add_subplot(1, 1, 1)
+
+        ax.set_xlabel("x", fontsize=12)
+        ax.set_ylabel("y", fontsize=12)
+        ax.grid(True, alpha=0.3)
+        ax.axhline(y=0, color='k', linestyle='-', alpha=0.2)
+        ax.axvline(x=0, color='k', linestyle='-', alpha=0.2)
+
+        self.curve, = ax.plot([], [], linewidth=2.5, color='#2A93D5')
+        # All members of a solution family are drawn as one collection
+        self.family = LineCollection([], linewidths=1.5, cmap='viridis', visible=False)
+        self.family.set_clim(*FAMILY_SPAN)
+        ax.add_collection(self.family)
+        self.markers = [
+            ax.axvline(x=0, color='r', linestyle='--', alpha=0.5, visible=False)
+            for _ in range(MAX_SINGULARITY_MARKERS)
+        ]
+        # The legend copies the handle's style, visibility included
+        self.markers[0].set_label('Singularity')
+        self.markers[0].set_visible(True)
+        self.legend = ax.legend(handles=[self.markers[0]])
+        self.markers[0].set_visible(False)
+        self.message = ax.text(0.5, 0.5, '', horizontalalignment='center',
+                               verticalalignment='center', transform=ax.transAxes,
+                               fontsize=12, visible=False)
+        self.title = ax.set_title("Solution: y", fontsize=14)
+        self.caption = self.figure.text(0.5, 0.01, "DE:", ha='center', fontsize=10)
+
+        # Lay out once with placeholder texts; requests only change contents
+        self.figure.tight_layout(rect=LAYOUT_RECT)
+
+    def render(self, x, y, title, caption, singularities=(), message=None,
+               family=None, family_colors=None):
+        """
+        Draw the curve (x, y), or the family of curves given as a list of
+        (points, 2) arrays coloured by family_colors, and return the plot as
+        PNG bytes.
+        """
+        self.curve.set_data(x, y)
+        self.curve.set_visible(len(x) > 0)
+
+        self.family.set_segments(family or [])
+        self.family.set_array(np.asarray(family_colors if family else [], dtype=float))
+        self.family.set_visible(bool(family))
+
+        self.message.set_text(message or '')
+        self.message.set_visible(bool(message))
+
+        singularities = list(singularities)[:MAX_SINGULARITY_MARKERS]
+        for i, marker in enumerate(self.markers):
+            if i < len(singularities):
+                marker.set_xdata([singularities[i], singularities[i]])
+                marker.set_visible(True)
+            else:
+                marker.set_visible(False)
+        self.legend.set_visible(bool(singularities))
+
+        self.title.set_text(title)
+        self.caption.set_text(caption)
+
+        # relim only looks at lines, so the family's points are added by hand
+        self.axes.relim(visible_only=True)
+        if family:
+            points = np.concatenate(family)
+            self.axes.update_datalim(points[np.isfinite(points).all(axis=1)])
+        self.axes.autoscale_view()
+
+        buf = io.BytesIO()
+        self.canvas.print_png(buf)
+        return buf.getvalue()
+
+
+class MessagePlotTemplate:
+    """A plot that shows nothing but a centred message."""
+
+    def __init__(self):
+        self.figure = Figure(figsize=FIGSIZE, dpi=DPI)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot(1, 1, 1)
+        self.message = ax.text(0.5, 0.5, '', horizontalalignment='center',
+                               verticalalignment='center', transform=ax.transAxes,
+                               fontsize=12)
+        self.figure.tight_layout()
+
+    def render(self, message):
+        self.message.set_text(message)
+        buf = io.BytesIO()
+        self.canvas.print_png(buf)
+        return buf.getvalue()
+
+
+class VectorFieldTemplate:
+    """
+    A direction field (slope fields, phase portraits) with optional
+    trajectories; the arrows, lines and texts are replaced per render.
+    """
+
+    def __init__(self):
+        self.figure = Figure(figsize=FIGSIZE, dpi=DPI)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.axes = self.figure.add_subplot(1, 1, 1)
+
+        self.xlabel = ax.set_xlabel("x", fontsize=12)
+        self.ylabel = ax.set_ylabel("y", fontsize=12)
+        ax.grid(True, alpha=0.3)
+        ax.axhline(y=0, color='k', linestyle='-', alpha=0.2)
+        ax.axvline(x=0, color='k', linestyle='-', alpha=0.2)
+        self.quiver = None
+        self.lines = LineCollection([], linewidths=1.5, colors='#D5402A', visible=False)
+        ax.add_collection(self.lines)
+        self.title = ax.set_title("Slope field: y' = f(x, y)", fontsize=14)
+        self.figure.tight_layout()
+
+    def render(self, x, y, u, v, title, xlabel="x", ylabel="y", lines=None):
+        """
+        Draw the directions (u, v), given in data units on the grid x by y,
+        and the trajectories in lines ((points, 2) arrays); return the plot
+        as PNG bytes.
+        """
+        ax = self.axes
+        dx = (x[-1] - x[0]) / max(x.size - 1, 1)
+        dy = (y[-1] - y[0]) / max(y.size - 1, 1)
+        ax.set_xlim(x[0] - dx, x[-1] + dx)
+        ax.set_ylim(y[0] - dy, y[-1] + dy)
+
+        # Unit directions in pixels, so every arrow has the same on-screen
+        # length whatever the aspect ratio of the ranges
+        px = ax.bbox.width / (x[-1] - x[0] + 2 * dx)
+        py = ax.bbox.height / (y[-1] - y[0] + 2 * dy)
+        u, v = px * u, py * v
+        with np.errstate(invalid='ignore', divide='ignore'):
+            norm = np.hypot(u, v)
+            u, v = u / norm, v / norm
+        length = 0.7 * min(px * dx, py * dy) if x.size > 1 and y.size > 1 else 20.0
+
+        if self.quiver is not None:
+            self.quiver.remove()
+        self.quiver = ax.quiver(
+            x, y, np.ma.masked_invalid(u), np.ma.masked_invalid(v),
+            angles='uv', pivot='mid', scale_units='dots', scale=1.0 / length,
+            color='#2A93D5', width=0.002, headwidth=3, headlength=3, headaxislength=2.5,
+        )
+        self.lines.set_segments(lines or [])
+        self.lines.set_visible(bool(lines))
+
+        self.title.set_text(title)
+        self.xlabel.set_text(xlabel)
+        self.ylabel.set_text(ylabel)
+
+        buf = io.BytesIO()
+        self.canvas.print_png(buf)
+        return buf.getvalue()
+
+
+# One set of templates per thread: Figures must not be drawn concurrently
+_local = threading.local()
+
+
+def _template(cls):
+    template = getattr(_local, cls.__name__, None)
+    if template is None:
+        template = cls()
+        setattr(_local, cls.__name__, template)
+    return template
+
+
+def close_templates():
+    """Release this thread's figures; they are rebuilt on the next render."""
+    for cls in (SolutionPlotTemplate, MessagePlotTemplate, VectorFieldTemplate):
+        template = getattr(_local, cls.__name__, None)
+        if template is not None:
+            template.figure.clear()
+            delattr(_local, cls.__name__)
+
+
+# Small pre-rendered image shown in place of a plot that could not be drawn
+PLACEHOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'static', 'img', 'plot-unavailable.png')
+PLACEHOLDER_URL = '/static/img/plot-unavailable.png'
+_placeholder_png = None
+
+
+def placeholder_png():
+    """Return the placeholder image bytes, read from disk once."""
+    global _placeholder_png
+    if _placeholder_png is None:
+        with open(PLACEHOLDER_PATH, 'rb') as f:
+            _placeholder_png = f.read()
+    return _placeholder_png
+
+
+def render_message(message):
+    """Render a plot that only shows message, as PNG bytes."""
+    return _template(MessagePlotTemplate).render(message)
+
+
+def render_error_plot(error):
+    """Render a full-size image explaining a PlotError, for clients that ask for one."""
+    return render_message(error.message)
+
+
+def render_curve(de, solution, curve):
+    """Draw a sampled solution curve and return the plot as PNG bytes."""
+    x, y = curve.x, curve.y
+
+    # Limit y values to a reasonable range for display; NaN breaks the line
+    with np.errstate(invalid='ignore'):
+        display = np.isfinite(y) & (np.abs(y) < Y_LIMIT)
+    y_plot = np.where(display, y, np.nan)
+
+    # Break the line between pieces so it never crosses a singularity
+    stops = [stop for _, stop in curve.segments[:-1]]
+    x_plot = np.insert(x, stops, np.nan)
+    y_plot = np.insert(y_plot, stops, np.nan)
+
+    message = None if display.any() else "Function values out of displayable range"
+    try:
+        return _template(SolutionPlotTemplate).render(
+            x_plot, y_plot,
+            title=f"Solution: {solution}",
+            caption=f"DE: {de}",
+            singularities=[s['x'] for s in curve.singularities],
+            message=message,
+        )
+    except Exception as e:
+        # Drop this thread's figures in case the failure left them inconsistent
+        close_templates()
+        raise PlotError('render_error', f"Error generating plot: {str(e)}")
+
+
+def render_family(de, solution, family):
+    """Draw every member of a sampled solution family and return the plot as PNG bytes."""
+    with np.errstate(invalid='ignore'):
+        display = np.isfinite(family.y) & (np.abs(family.y) < Y_LIMIT)
+    y_plot = np.where(display, family.y, np.nan)
+    lines = [np.column_stack((family.x, row)) for row in y_plot]
+
+    caption = f"DE: {de}"
+    if family.constants:
+        caption += f"   ({', '.join(family.constants)} from {FAMILY_SPAN[0]:g} to {FAMILY_SPAN[1]:g})"
+    message = None if display.any() else "Function values out of displayable range"
+    try:
+        return _template(SolutionPlotTemplate).render(
+            [], [],
+            title=f"Solution family: {solution}",
+            caption=caption,
+            message=message,
+            # Colour by the first constant
+            family=lines,
+            family_colors=family.values[:, 0] if family.constants else np.zeros(len(lines)),
+        )
+    except Exception as e:
+        close_templates()
+        raise PlotError('render_error', f"Error generating plot: {str(e)}")
+
+
+def render_slope_field(de, field):
+    """Draw a slope field of the equation and return the plot as PNG bytes."""
+    try:
+        return _template(VectorFieldTemplate).render(
+            field.x, field.y, field.u, field.v, title=f"Slope field: {de}"
+        )
+    except Exception as e:
+        close_templates()
+        raise PlotError('render_error', f"Error generating plot: {str(e)}")
+
+
+def render_phase_portrait(de, field, trajectories):
+    """
+    Draw a phase portrait of the equation, the PhaseField and the Trajectories
+    in the (y, y') plane, and return the plot as PNG bytes.
+    """
+    y, dy = trajectories.states[0], trajectories.states[1]
+    lines = [np.column_stack((y[i], dy[i])) for i in range(y.shape[0])]
+    try:
+        return _template(VectorFieldTemplate).render(
+            field.y, field.v, field.dy, field.dv, title=f"Phase portrait: {de}",
+            xlabel="y", ylabel="y'", lines=lines,
+        )
+    except Exception as e:
+        close_templates()
+        raise PlotError('render_error', f"Error generating plot: {str(e)}")
+
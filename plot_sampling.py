@@ -0,0 +1,300 @@
+"""
+Adaptive sampling of solution curves for plotting.
+
+A fixed grid wastes points where a curve is flat and under-resolves
+oscillations and poles. The sampler starts from a coarse uniform grid and
+repeatedly bisects the segments where the curve strays from the straight
+line drawn between its ends, evaluating all new midpoints of a level in one
+vectorized call, until the curve is resolved or a point budget is spent.
+Every evaluated point ends up in the curve.
+"""
+import numpy as np
+
+from verification import real_array
+
+# Uniform grid the refinement starts from
+INITIAL_POINTS = 65
+
+# Upper bound on evaluations per curve
+MAX_PLOT_POINTS = 2000
+
+# Each level halves the refined segments; stop after this many levels
+MAX_DEPTH = 14
+
+# A segment is split when its midpoint is off the chord by more than this
+# fraction of the plotted height
+TOLERANCE = 1e-3
+
+
+def evaluate_curve(func, x):
+    """Evaluate func on x as real floats, NaN where undefined."""
+    with np.errstate(all='ignore'):
+        return real_array(func(x), x.shape)
+
+
+def _evaluate_extended(func, x):
+    """Like evaluate_curve, but keeps +-inf where the value overflows or divides by zero."""
+    with np.errstate(all='ignore'):
+        values = np.broadcast_to(np.asarray(func(x)), x.shape)
+        real = np.real(values).astype(float)
+        return np.where(np.isinf(real), real, real_array(values, x.shape))
+
+
+def adaptive_sample(func, lo, hi, y_limit, initial_points=INITIAL_POINTS,
+                    max_points=MAX_PLOT_POINTS, tolerance=TOLERANCE, max_depth=MAX_DEPTH):
+    """
+    Sample func on [lo, hi], returning sorted arrays (x, y).
+
+    Values are compared after clipping to [-y_limit, y_limit], the range the
+    plot shows, so refinement near a pole stops at the plot's edge instead of
+    chasing the value to infinity. A segment is also split when exactly one
+    of its ends or its midpoint is undefined, which pins down where the
+    function's domain begins and ends.
+    """
+    x = np.linspace(lo, hi, initial_points)
+    y = evaluate_curve(func, x)
+    budget = max_points - x.size
+
+    # Segments whose midpoints are tested at the next level; after the first
+    # level only the halves of segments that were just split
+    active = np.arange(x.size - 1)
+
+    for _ in range(max_depth):
+        if budget <= 0 or not active.size:
+            break
+        if active.size > budget:
+            # Test the widest segments first
+            widths = x[active + 1] - x[active]
+            active = np.sort(active[np.argsort(widths, kind='stable')[::-1][:budget]])
+
+        valid = np.isfinite(y)
+        clipped = np.clip(np.where(valid, y, 0.0), -y_limit, y_limit)
+        finite_clipped = clipped[valid]
+        height = np.ptp(finite_clipped) if finite_clipped.size else 0.0
+        threshold = tolerance * max(height, 1e-12)
+
+        left, right = active, active + 1
+        mid = 0.5 * (x[left] + x[right])
+        y_mid = evaluate_curve(func, mid)
+        budget -= mid.size
+        mid_valid = np.isfinite(y_mid)
+        mid_clipped = np.clip(np.where(mid_valid, y_mid, 0.0), -y_limit, y_limit)
+
+        both_valid = valid[left] & valid[right]
+        chord = 0.5 * (clipped[left] + clipped[right])
+        error = np.where(both_valid & mid_valid, np.abs(mid_clipped - chord), 0.0)
+        # Domain edges: refine wherever validity changes inside the segment
+        edge = (valid[left] != valid[right]) | (both_valid & ~mid_valid)
+
+        split = edge | (error > threshold)
+
+        # Keep every evaluated midpoint; only the halves of segments whose
+        # midpoint was off the chord are tested again
+        x = np.insert(x, active + 1, mid)
+        y = np.insert(y, active + 1, y_mid)
+        first_half = active + np.arange(active.size)
+        split_first = first_half[split]
+        active = np.sort(np.concatenate((split_first, split_first + 1)))
+
+    return x, y
+
+
+# Bisection steps used to pin down each singularity
+BISECTION_STEPS = 48
+
+# A singularity is a pole when |y| next to it is this many times larger than
+# at the samples it was found from
+POLE_GROWTH = 1e4
+
+# Neighbouring samples further apart than this fraction of the plotted height
+# (or than y_limit) may straddle a jump
+JUMP_FRACTION = 0.25
+
+# The function is probed this fraction of the plotted range either side of
+# a domain edge, to tell undefined intervals from undefined points
+PROBE_FRACTION = 1e-9
+
+
+def _locate_domain_edges(func, a, b, left_valid):
+    """Bisect [a, b] towards the point where the function becomes (un)defined."""
+    for _ in range(BISECTION_STEPS):
+        mid = 0.5 * (a + b)
+        in_left = np.isfinite(evaluate_curve(func, mid)) != left_valid
+        a = np.where(in_left, a, mid)
+        b = np.where(in_left, mid, b)
+    # Value at the defined end decides whether the edge is a pole
+    edge_values = evaluate_curve(func, np.where(left_valid, a, b))
+    return 0.5 * (a + b), np.abs(edge_values)
+
+
+def _locate_peaks(func, lo, peak, hi, f_peak):
+    """
+    Narrow each bracket lo < peak < hi around the maximum of |f|.
+
+    Every step evaluates the midpoints of both halves and keeps the
+    neighbours of the largest of the five values, halving the bracket. An
+    undefined value means the search landed on the singularity itself.
+    """
+    f_peak = np.abs(f_peak)
+    hit = np.zeros(peak.shape, dtype=bool)
+    for _ in range(BISECTION_STEPS):
+        left, right = 0.5 * (lo + peak), 0.5 * (peak + hi)
+        f_left = np.abs(evaluate_curve(func, left))
+        f_right = np.abs(evaluate_curve(func, right))
+        hit |= ~np.isfinite(f_left) | ~np.isfinite(f_right)
+        f_left = np.where(np.isfinite(f_left), f_left, np.inf)
+        f_right = np.where(np.isfinite(f_right), f_right, np.inf)
+
+        go_left = (f_left > f_peak) & (f_left >= f_right)
+        go_right = (f_right > f_peak) & ~go_left
+        # Otherwise the peak stays and the bracket shrinks around it
+        lo, peak, hi, f_peak = (
+            np.where(go_left, lo, np.where(go_right, peak, left)),
+            np.where(go_left, left, np.where(go_right, right, peak)),
+            np.where(go_left, peak, np.where(go_right, hi, right)),
+            np.where(go_left, f_left, np.where(go_right, f_right, f_peak)),
+        )
+    return peak, np.where(hit, np.inf, f_peak)
+
+
+def _locate_jumps(func, a, b, fa, fb):
+    """
+    Bisect [a, b] towards the larger change in value.
+
+    Returns the locations and whether each one is a genuine discontinuity:
+    the change does not shrink with the interval, as it would for a smooth
+    but steep function.
+    """
+    initial = np.abs(fb - fa)
+    for _ in range(BISECTION_STEPS):
+        mid = 0.5 * (a + b)
+        fm = evaluate_curve(func, mid)
+        keep_left = ~(np.abs(fb - fm) > np.abs(fm - fa))
+        a, fa = np.where(keep_left, a, mid), np.where(keep_left, fa, fm)
+        b, fb = np.where(keep_left, mid, b), np.where(keep_left, fm, fb)
+    final = np.abs(fb - fa)
+    genuine = ~(final < 0.5 * initial)
+    return 0.5 * (a + b), genuine
+
+
+def find_singularities(func, x, y, y_limit):
+    """
+    Find the singularities of a sampled curve in one vectorized pass.
+
+    Three kinds of candidates are taken from the samples:
+    - gaps where one side is defined and the other is not: domain edges, or
+      poles and jumps that were sampled exactly
+    - interior local maxima of |y| beyond y_limit, which is where the curve
+      blows up through extreme magnitudes, with or without a sign flip
+      (1/(x - 1), tan(x), 1/x^2)
+    - gaps across which y changes by a large part of the plotted height:
+      jumps
+    All candidates of a kind are refined by bisection together. A peak is a
+    pole only when |y| keeps growing as it is narrowed down, and a jump is
+    genuine only when the change does not shrink with the interval, so steep
+    but smooth curves are not reported.
+
+    A gap is classified from the values just either side of it. Finite
+    values on both sides make it an undefined point: a pole when the value
+    grew towards it, a jump (abs(x)/x) when the two sides differ, and
+    otherwise a removable hole that is not reported. An infinite value on
+    the undefined side is a pole (exp(1/x) at 0), unless the defined side is
+    already off the plot: then the value merely overflowed.
+
+    Returns a sorted list of {'x': location, 'kind': 'pole' | 'jump' |
+    'domain_edge'}.
+    """
+    valid = np.isfinite(y)
+    magnitude = np.where(valid, np.abs(y), 0.0)
+    locations, kinds = [], []
+
+    finite = magnitude[valid]
+    height = np.ptp(np.clip(finite, 0, y_limit)) if finite.size else 0.0
+    threshold = min(y_limit, JUMP_FRACTION * max(height, 1e-12))
+
+    i = np.flatnonzero(valid[:-1] != valid[1:])
+    if i.size:
+        left_valid = valid[i]
+        where, edge_magnitude = _locate_domain_edges(func, x[i], x[i + 1], left_valid)
+        start_magnitude = np.where(left_valid, magnitude[i], magnitude[i + 1])
+        probe = PROBE_FRACTION * max(x[-1] - x[0], 1e-12)
+        before = _evaluate_extended(func, where - probe)
+        after = _evaluate_extended(func, where + probe)
+        undefined_side = np.where(left_valid, after, before)
+        with np.errstate(all='ignore'):
+            grew = edge_magnitude > POLE_GROWTH * np.maximum(start_magnitude, 1.0)
+            isolated = np.isfinite(before) & np.isfinite(after)
+            jump = isolated & (np.abs(after - before) > threshold)
+            overflow = np.isinf(undefined_side)
+            pole = grew | (~isolated & overflow & ~(edge_magnitude > y_limit))
+        kind = np.where(pole, 'pole', np.where(jump, 'jump', 'domain_edge'))
+        # Removable holes and overflows off the plot are not singularities
+        keep = pole | jump | ~(isolated | overflow)
+        locations.append(where[keep])
+        kinds.append(kind[keep])
+
+    inner = np.arange(1, x.size - 1)
+    peak = (
+        valid[inner] & (magnitude[inner] > y_limit)
+        & (magnitude[inner] >= magnitude[inner - 1])
+        & (magnitude[inner] >= magnitude[inner + 1])
+    )
+    i = inner[peak]
+    if i.size:
+        where, peak_magnitude = _locate_peaks(func, x[i - 1], x[i], x[i + 1], y[i])
+        with np.errstate(all='ignore'):
+            pole = peak_magnitude > POLE_GROWTH * magnitude[i]
+        locations.append(where[pole])
+        kinds.append(np.full(np.count_nonzero(pole), 'pole'))
+
+    with np.errstate(invalid='ignore'):
+        i = np.flatnonzero(valid[:-1] & valid[1:] & (np.abs(np.diff(y)) > threshold))
+    if i.size:
+        where, genuine = _locate_jumps(func, x[i], x[i + 1], y[i], y[i + 1])
+        locations.append(where[genuine])
+        kinds.append(np.full(np.count_nonzero(genuine), 'jump'))
+
+    if not locations:
+        return []
+
+    locations = np.concatenate(locations)
+    kinds = np.concatenate(kinds)
+    order = np.argsort(locations, kind='stable')
+    locations, kinds = locations[order], kinds[order]
+
+    # A pole is usually found as a peak and as a jump; keep one entry,
+    # preferring 'pole'
+    tolerance = 1e-6 * max(x[-1] - x[0], 1e-12)
+    singularities = []
+    for location, kind in zip(locations.tolist(), kinds.tolist()):
+        if singularities and location - singularities[-1]['x'] <= tolerance:
+            if kind == 'pole':
+                singularities[-1]['kind'] = kind
+            continue
+        # + 0.0 turns -0.0 into 0.0
+        singularities.append({'x': location + 0.0, 'kind': kind})
+    return singularities
+
+
+def split_segments(x, y, singularities):
+    """
+    Split a sampled curve into continuous pieces.
+
+    Returns [(start, stop)] index ranges of runs of defined samples that do
+    not straddle a singularity.
+    """
+    valid = np.isfinite(y)
+    if x.size < 2:
+        return [(0, int(x.size))] if valid.all() and x.size else []
+
+    breaks = ~(valid[:-1] & valid[1:])
+    if singularities:
+        where = np.array([s['x'] for s in singularities])
+        gaps = np.clip(np.searchsorted(x, where) - 1, 0, x.size - 2)
+        breaks[gaps] = True
+
+    before = np.concatenate(([True], breaks))
+    after = np.concatenate((breaks, [True]))
+    starts = np.flatnonzero(valid & before)
+    stops = np.flatnonzero(valid & after) + 1
+    return list(zip(starts.tolist(), stops.tolist()))
@@ -0,0 +1,157 @@
+"""
+Content-addressed store of rendered plots.
+
+A plot is named by the SHA-256 of everything that determines its pixels (the
+canonical equation and solution, the plotted range and a style version), so a
+repeated request finds the finished PNG and skips rendering altogether. PNGs
+are kept as files in one directory, which every worker process of the app
+shares, and served from /plots/<hash>.png. Once the directory grows past its
+byte budget the least recently used files are removed.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+PLOT_STORE_DIR = os.environ.get(
+    'PLOT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'de-analyzer-plots')
+)
+PLOT_STORE_BYTES = int(os.environ.get('PLOT_STORE_BYTES', 64 * 1024 * 1024))
+
+# x range of solution plots
+PLOT_RANGE = (-5.0, 5.0)
+
+# Change whenever the look of the plots changes, so old images are not reused
+PLOT_STYLE = 'solution-v5'
+
+# Evict down to this fraction of the budget so eviction does not run on every put
+_EVICT_TO = 0.9
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def plot_key(*parts):
+    """Return the hex digest naming a plot built from parts (JSON-serializable)."""
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+class PlotStore:
+    """
+    Directory of PNGs named by digest, bounded by total size.
+
+    Reads touch the file's modification time, so eviction removes the least
+    recently used plots first. Writes go through a temporary file and an
+    atomic rename, so a reader never sees half a PNG.
+    """
+
+    def __init__(self, directory=PLOT_STORE_DIR, max_bytes=PLOT_STORE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, digest):
+        if not DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid plot digest: {digest}")
+        return os.path.join(self.directory, f"{digest}.png")
+
+    def _scan(self):
+        """Return [(mtime, size, path)] for every stored plot."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def has(self, digest, count=True):
+        """
+        Return whether the plot is stored, marking it as recently used.
+        Repeat probes for the same request pass count=False, so they do not
+        show up in the hit rate.
+        """
+        try:
+            os.utime(self._path(digest))
+        except FileNotFoundError:
+            if count:
+                self.misses += 1
+            return False
+        if count:
+            self.hits += 1
+        return True
+
+    def get(self, digest):
+        """Return the PNG bytes for digest, or None."""
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                png = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return png
+
+    def put(self, digest, png):
+        path = self._path(digest)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._bytes += len(png)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes share the directory, so work from what is on disk
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * _EVICT_TO:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def stats(self):
+        entries = self._scan()
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+PLOT_STORE = PlotStore()
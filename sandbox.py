@@ -0,0 +1,303 @@
+"""
+Budgeted execution of symbolic work in pre-forked worker processes.
+
+A pathological input (a huge exponent, a deeply nested solution) can keep
+parse_expr, diff, solve or lambdify busy for minutes, or eat all memory. Every
+symbolic job therefore runs in one of a fixed pool of worker processes under
+a per-job budget:
+
+- CPU time: RLIMIT_CPU is set to the worker's usage so far plus
+  SANDBOX_CPU_SECONDS before each job, so the kernel kills a worker that
+  overruns
+- memory: RLIMIT_AS is set to the worker's current size plus
+  SANDBOX_MEMORY_MB, so an overrunning job gets a MemoryError; this limits
+  address space, which bounds the resident size from above
+- wall time: the caller stops waiting after SANDBOX_WALL_SECONDS (a job
+  blocked without using CPU) and kills the worker
+
+A worker that overran is killed and replaced, and the caller gets
+BudgetExceeded. The pool size bounds how many symbolic jobs run at once, so
+one user's input can only ever hold one worker and tail latency for everyone
+else stays bounded.
+
+Workers are forked by a single-threaded fork server that imports the
+symbolic modules once, so a new worker starts warm, and neither the pool
+nor a replacement worker is ever forked from a process running request
+threads. Start the pools with start() before serving. Caches filled inside
+the workers are reported back after every job (see SandboxPool.cache_stats).
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+from parse_cache import merge_stats
+
+# Conditionally import resource; rlimits are POSIX-only
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# Worker processes; 0 runs jobs in the calling process without budgets
+SANDBOX_WORKERS = int(os.environ.get('SANDBOX_WORKERS', min(4, os.cpu_count() or 1)))
+SANDBOX_CPU_SECONDS = int(os.environ.get('SANDBOX_CPU_SECONDS', 10))
+SANDBOX_MEMORY_MB = int(os.environ.get('SANDBOX_MEMORY_MB', 512))
+SANDBOX_WALL_SECONDS = float(os.environ.get('SANDBOX_WALL_SECONDS', 30))
+
+# Process name of the workers; set before a worker imports the main script
+_WORKER_NAME = 'sandbox-worker'
+
+
+class BudgetExceeded(Exception):
+    """
+    A job that ran out of its budget and was killed.
+
+    resource is 'cpu', 'memory' or 'time'; limit is the budget in seconds or
+    megabytes.
+    """
+
+    def __init__(self, resource, limit):
+        units = 'MB' if resource == 'memory' else 's'
+        super().__init__(f"The computation exceeded its {resource} budget of {limit:g} {units} and was stopped.")
+        self.resource = resource
+        self.limit = limit
+        self.message = str(self)
+
+    def __reduce__(self):
+        return (BudgetExceeded, (self.resource, self.limit))
+
+    def to_dict(self):
+        return {'code': 'budget_exceeded', 'resource': self.resource,
+                'limit': self.limit, 'message': self.message}
+
+
+def _address_space():
+    """Current virtual size of this process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _set_budget(cpu_seconds, memory_bytes):
+    if not RESOURCE_AVAILABLE:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    soft = used + cpu_seconds
+    if hard == resource.RLIM_INFINITY or soft <= hard:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    size = _address_space()
+    if size is not None:
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        soft = size + memory_bytes
+        if hard == resource.RLIM_INFINITY or soft <= hard:
+            resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _clear_memory_budget():
+    if RESOURCE_AVAILABLE:
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        resource.setrlimit(resource.RLIMIT_AS, (hard, hard))
+
+
+def _worker_main(conn, cpu_seconds, memory_bytes, report):
+    # The parent's handlers (e.g. the SIGTERM one of serve mode) do not apply
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            func, args = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        _set_budget(cpu_seconds, memory_bytes)
+        try:
+            reply = ('ok', func(*args))
+        except MemoryError:
+            reply = ('memory', None)
+        except Exception as e:
+            reply = ('error', e)
+        _clear_memory_budget()
+        stats = report() if report is not None else None
+
+        try:
+            conn.send(reply + (stats,))
+        except Exception as e:
+            # Results and exceptions must pickle; report what could not
+            conn.send(('error', RuntimeError(f"{type(reply[1]).__name__}: {reply[1]} ({e})"), stats))
+        if reply[0] == 'memory':
+            # Memory may be fragmented or state half-built; start afresh
+            return
+
+
+class _Worker:
+    def __init__(self, context, cpu_seconds, memory_bytes, report):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, cpu_seconds, memory_bytes, report),
+            name=_WORKER_NAME, daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        # What the worker reported with its latest reply
+        self.report = None
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Fixed pool of worker processes running one budgeted job each at a time.
+
+    report, when given, is called in a worker after every job and must return
+    a dict of cache name to ParseCache.stats() for the caches in that worker;
+    preload names the modules the fork server imports up front. Both are
+    pickled by reference, so they must live in importable modules (not in
+    the script being run).
+    """
+
+    def __init__(self, workers=SANDBOX_WORKERS, cpu_seconds=SANDBOX_CPU_SECONDS,
+                 memory_mb=SANDBOX_MEMORY_MB, wall_seconds=SANDBOX_WALL_SECONDS,
+                 report=None, preload=()):
+        self.workers = workers
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_seconds = wall_seconds
+        self.report = report
+        self.preload = list(preload)
+        # Forking from a threaded web process can deadlock the child on a lock
+        # some other thread held; the fork server is single-threaded
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._workers = []
+        # Cache counters of the workers replaced so far
+        self._retired = {}
+        self.jobs = 0
+        self.exceeded = {'cpu': 0, 'memory': 0, 'time': 0}
+        self.recycled = 0
+
+    def _spawn(self):
+        worker = _Worker(self._context, self.cpu_seconds, self.memory_mb * 1024 * 1024, self.report)
+        self._workers.append(worker)
+        return worker
+
+    def start(self):
+        """
+        Start the workers, if not started yet; call it before serving. Does
+        nothing in a worker, which imports the main script (and whatever
+        starts the pools there) before it runs its first job.
+        """
+        if self.workers <= 0 or multiprocessing.current_process().name == _WORKER_NAME:
+            return
+        with self._lock:
+            if not self._started:
+                if self.preload and self._context.get_start_method() == 'forkserver':
+                    # Only takes effect before the fork server first starts
+                    self._context.set_forkserver_preload(self.preload)
+                for _ in range(self.workers):
+                    self._idle.put(self._spawn())
+                self._started = True
+
+    def _replace(self, worker):
+        worker.kill()
+        with self._lock:
+            self._workers.remove(worker)
+            # The counters of a replaced worker still count; its entries are gone
+            for name, stats in (worker.report or {}).items():
+                retired = dict(stats, entries=0, bytes=0)
+                self._retired[name] = merge_stats([self._retired[name], retired]) if name in self._retired else retired
+            self.recycled += 1
+            return self._spawn()
+
+    def run(self, func, *args):
+        """
+        Run func(*args) in a worker and return its result, re-raising its
+        exception. func, args and the result must pickle. Raises
+        BudgetExceeded when the job overruns its budget.
+        """
+        if self.workers <= 0:
+            return func(*args)
+        self.start()
+
+        # Blocks while every worker is busy
+        worker = self._idle.get()
+        replace = False
+        try:
+            self.jobs += 1
+            worker.conn.send((func, args))
+            if not worker.conn.poll(self.wall_seconds):
+                replace = True
+                raise self._exceeded('time', self.wall_seconds)
+            try:
+                status, value, worker.report = worker.conn.recv()
+            except (EOFError, OSError):
+                replace = True
+                worker.process.join(1)
+                if worker.process.exitcode == -getattr(signal, 'SIGXCPU', -1):
+                    raise self._exceeded('cpu', self.cpu_seconds)
+                if worker.process.exitcode == -signal.SIGKILL:
+                    # Most likely the kernel's out-of-memory killer
+                    raise self._exceeded('memory', self.memory_mb)
+                raise RuntimeError(f"Sandbox worker exited with code {worker.process.exitcode}")
+            if status == 'memory':
+                replace = True
+                raise self._exceeded('memory', self.memory_mb)
+            if status == 'error':
+                raise value
+            return value
+        finally:
+            if replace:
+                worker = self._replace(worker)
+            self._idle.put(worker)
+
+    def _exceeded(self, resource_name, limit):
+        self.exceeded[resource_name] += 1
+        return BudgetExceeded(resource_name, limit)
+
+    def shutdown(self):
+        with self._lock:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                worker.kill()
+                self._workers.remove(worker)
+            self._started = False
+
+    def cache_stats(self):
+        """
+        Return the caches reported by the workers, by name: each combined over
+        the live workers and the ones replaced so far (see merge_stats).
+        """
+        with self._lock:
+            reports = [worker.report for worker in self._workers if worker.report]
+            reports.append(self._retired)
+        names = {name for report in reports for name in report}
+        return {name: merge_stats([report[name] for report in reports if name in report]) for name in sorted(names)}
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'idle': self._idle.qsize() if self._started else self.workers,
+            'cpu_seconds': self.cpu_seconds,
+            'memory_mb': self.memory_mb,
+            'wall_seconds': self.wall_seconds,
+            'jobs': self.jobs,
+            'exceeded': dict(self.exceeded),
+            'recycled': self.recycled,
+        }
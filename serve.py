@@ -0,0 +1,123 @@
+"""
+Resident JSON-lines mode for the command-line checkers.
+
+Started with --serve, linearity_checker.py and solution_verifier.py stay
+running, so Python start-up and the SymPy, NumPy and matplotlib imports are
+paid once, and the parse and derivative caches stay warm between requests.
+
+Each request is one line of JSON, either with the script's named fields
+
+    {"id": 1, "equation": "y' + y = x"}
+
+or with the same positional arguments the one-shot script takes
+
+    {"id": 2, "args": ["y' = y", "y = e^x"]}
+
+and each response is one line of JSON: exactly what the one-shot script would
+have printed, plus the request's id when one was given and the exit_code the
+script would have exited with (0 or 1). Requests are read from stdin, or from
+a UNIX socket with --socket PATH.
+"""
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+
+# Scripts and plotting are not thread-safe, so socket clients take turns
+_handler_lock = threading.Lock()
+
+
+def request_args(request, fields):
+    """
+    Turn a request into the script's positional arguments.
+
+    An explicit "args" list wins; otherwise the named fields are taken in
+    order, stopping at the first one that is missing.
+    """
+    if 'args' in request:
+        return [str(arg) for arg in request['args']]
+    args = []
+    for field in fields:
+        if request.get(field) is None:
+            break
+        args.append(str(request[field]))
+    return args
+
+
+def handle_line(line, handler):
+    """Answer one request line with one response dict."""
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError('request must be a JSON object')
+    except ValueError as e:
+        return {'status': 'error', 'message': f"Invalid request: {str(e)}", 'exit_code': 1}
+
+    with _handler_lock:
+        try:
+            response, ok = handler(request)
+        except Exception as e:
+            response, ok = {'status': 'error', 'message': f"Error handling request: {str(e)}"}, False
+
+    response = dict(response, exit_code=0 if ok else 1)
+    if 'id' in request:
+        response['id'] = request['id']
+    return response
+
+
+def _serve_stream(lines, out, handler):
+    for line in lines:
+        if not line.strip():
+            continue
+        out.write(json.dumps(handle_line(line, handler)) + '\n')
+        out.flush()
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            response = handle_line(line, self.server.request_handler)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(handler, argv=None):
+    """
+    Run handler(request) -> (response, ok) for every request until stdin
+    closes (or forever, on a socket); ok is False where the one-shot script
+    would exit with an error status.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    socket_path = None
+    if '--socket' in argv:
+        socket_path = argv[argv.index('--socket') + 1]
+
+    # Anything printed while handling a request must not corrupt the
+    # response stream
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    if socket_path is None:
+        _serve_stream(sys.stdin, out, handler)
+        return
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = _UnixServer(socket_path, _ConnectionHandler)
+    server.request_handler = handler
+    # Let SIGTERM unwind through the finally so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
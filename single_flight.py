@@ -0,0 +1,175 @@
+"""
+Coalescing of identical work that is already in flight.
+
+When a class assignment goes out, dozens of identical requests arrive within
+seconds. Instead of every one of them running SymPy and matplotlib, the
+first caller for a key computes the result and the others wait for it:
+
+- within a worker process, followers wait on the leader's Event and share
+  its result (or its exception)
+- across worker processes, leaders take an exclusive lock on a per-key file
+  and, once they hold it, look the result up in the shared store (verdict
+  store, plot store) that the previous holder filled in before computing
+
+Lock files are named by the key's hash in SINGLE_FLIGHT_DIR and pruned once
+they are old. Without fcntl (Windows) only the in-process coalescing is
+done.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# Conditionally import fcntl; file locks are POSIX-only
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Empty to coalesce within each process only
+SINGLE_FLIGHT_DIR = os.environ.get(
+    'SINGLE_FLIGHT_DIR', os.path.join(tempfile.gettempdir(), 'de-analyzer-locks')
+)
+
+# Give up waiting for another process after this many seconds and compute
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 30))
+
+_POLL_INTERVAL = 0.01
+
+# Lock files older than this are removed, checked every _PRUNE_EVERY calls
+_LOCK_MAX_AGE = 3600.0
+_PRUNE_EVERY = 1000
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run compute() once per key at a time, sharing the result with concurrent callers."""
+
+    def __init__(self, directory=SINGLE_FLIGHT_DIR, timeout=SINGLE_FLIGHT_TIMEOUT):
+        self.directory = directory if FCNTL_AVAILABLE else ''
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._count = 0
+        self.leaders = 0
+        self.followers = 0
+        self.shared = 0
+
+    def do(self, key, compute, lookup=None):
+        """
+        Return compute() for key, or the result of an identical call already
+        running in this process.
+
+        lookup() is tried once this process holds the cross-process lock for
+        key; a result other than None means another worker has just
+        computed it, and it is returned instead of computing again.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                self._count += 1
+                prune = self._count % _PRUNE_EVERY == 0
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_locked(key, compute, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if prune:
+                self._prune()
+
+    def _run_locked(self, key, compute, lookup):
+        if not self.directory:
+            return compute()
+
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(os.path.join(self.directory, f"{digest}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            logger.warning("Single-flight lock unavailable: %s", e)
+            return compute()
+
+        locked = False
+        try:
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                    # Keep a lock file in use from being pruned
+                    os.utime(fd)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        logger.warning("Gave up waiting for another worker on %s", digest)
+                        break
+                    time.sleep(_POLL_INTERVAL)
+
+            # Another worker may have stored the result since the caller looked
+            if lookup is not None:
+                result = lookup()
+                if result is not None:
+                    self.shared += 1
+                    return result
+            return compute()
+        finally:
+            if locked:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _prune(self):
+        if not self.directory:
+            return
+        cutoff = time.time() - _LOCK_MAX_AGE
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.lock') and os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'shared_across_workers': self.shared,
+                'cross_worker': bool(self.directory),
+            }
+
+
+SINGLE_FLIGHT = SingleFlight()
@@ -0,0 +1,59 @@
+"""
+Slope fields of first-order equations y' = f(x, y).
+
+f is compiled once per equation (see ode_system) and evaluated on the whole
+grid in a single NumPy call, so even tens of thousands of cells take a few
+milliseconds. Cells where f is undefined are NaN and left out of the plot.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from plot_data import encode_array
+from ode_system import ExplicitFormError, compile_ode
+
+# Default grid and bounds
+SLOPE_GRID = (25, 25)
+MAX_SLOPE_CELLS = 40000
+SLOPE_X_RANGE = (-5.0, 5.0)
+SLOPE_Y_RANGE = (-5.0, 5.0)
+
+# x: (nx,); y: (ny,); slope, u, v: (ny, nx) with (u, v) the unit direction
+SlopeField = namedtuple('SlopeField', 'x y slope u v')
+
+
+def slope_field(ode, x_range=SLOPE_X_RANGE, y_range=SLOPE_Y_RANGE, nx=SLOPE_GRID[0], ny=SLOPE_GRID[1]):
+    """Evaluate the slope of a first-order ExplicitODE on an nx by ny grid."""
+    if ode.order != 1:
+        raise ExplicitFormError("Slope fields need a first-order equation y' = f(x, y).")
+
+    x = np.linspace(x_range[0], x_range[1], nx)
+    y = np.linspace(y_range[0], y_range[1], ny)
+    slope = ode.evaluate(x[np.newaxis, :], y[:, np.newaxis])
+
+    # Direction (1, slope) scaled to unit length, in data units
+    norm = np.hypot(1.0, slope)
+    return SlopeField(x, y, slope, 1.0 / norm, slope / norm)
+
+
+def equation_slope_field(equation, x_range=SLOPE_X_RANGE, y_range=SLOPE_Y_RANGE,
+                         nx=SLOPE_GRID[0], ny=SLOPE_GRID[1]):
+    """Compile the equation and return (names of its other constants, SlopeField)."""
+    ode = compile_ode(equation)
+    return ode.constants, slope_field(ode, x_range, y_range, nx, ny)
+
+
+def field_payload(field):
+    """Return a slope field as JSON-ready data with base64 float32 arrays."""
+    return {
+        'nx': int(field.x.size),
+        'ny': int(field.y.size),
+        'dtype': 'float32',
+        'byte_order': 'little',
+        'undefined': int(np.count_nonzero(np.isnan(field.slope))),
+        'x': encode_array(field.x),
+        'y': encode_array(field.y),
+        'slope': encode_array(field.slope),
+        'u': encode_array(field.u),
+        'v': encode_array(field.v),
+    }
@@ -0,0 +1,201 @@
+"""
+Persistent store of linearity and verification verdicts.
+
+Every worker process of the app would otherwise recompute verdicts another
+worker already produced, and lose them all on every restart. Verdicts are
+kept in a local SQLite database in WAL mode, so all workers on a node share
+them, readers never block the writer, and hot results survive restarts and
+deploys without any external service.
+
+An entry is keyed by the SHA-256 of its kind, its canonical inputs and
+ENGINE_VERSION, so bumping the version retires every verdict produced by
+older logic. Entries expire after VERDICT_TTL seconds, and the least
+recently used ones are removed once there are more than VERDICT_MAX_ENTRIES.
+A store that cannot be opened or written is skipped: it never fails a
+request.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from single_flight import SINGLE_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Empty to disable the store
+VERDICT_DB = os.environ.get(
+    'VERDICT_DB', os.path.join(tempfile.gettempdir(), 'de-analyzer-verdicts.sqlite3')
+)
+VERDICT_TTL = float(os.environ.get('VERDICT_TTL', 7 * 24 * 3600))
+VERDICT_MAX_ENTRIES = int(os.environ.get('VERDICT_MAX_ENTRIES', 100000))
+
+# Change whenever the linearity or verification logic changes
+ENGINE_VERSION = 'verdict-v3'
+
+# Evict down to this fraction of the limit, checked every _EVICT_EVERY puts
+_EVICT_TO = 0.9
+_EVICT_EVERY = 100
+
+# Last-access times are only rewritten when older than this, so hot reads
+# do not turn into writes
+_TOUCH_AFTER = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+def verdict_key(kind, *parts):
+    """Return the hex digest naming a verdict of kind for parts (JSON-serializable)."""
+    text = json.dumps([ENGINE_VERSION, kind, parts])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class VerdictStore:
+    """
+    SQLite table of JSON verdicts shared by every process on the node.
+
+    Each thread uses its own connection. Values must be JSON-serializable
+    and come back as JSON (tuples become lists).
+    """
+
+    def __init__(self, path=VERDICT_DB, ttl=VERDICT_TTL, max_entries=VERDICT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.disabled = not path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection must not be used across fork (e.g. in the batch workers)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS verdicts_accessed ON verdicts (accessed)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _failed(self, action, error):
+        self.errors += 1
+        logger.warning("Verdict store %s failed: %s", action, error)
+
+    def get(self, key, count=True):
+        """
+        Return the stored verdict for key, or None. Repeat probes for the
+        same request pass count=False, so they do not show up in the hit rate.
+        """
+        if self.disabled:
+            return None
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT value, accessed FROM verdicts WHERE key = ? AND created > ?',
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is not None and now - row[1] > _TOUCH_AFTER:
+                conn.execute('UPDATE verdicts SET accessed = ? WHERE key = ?', (now, key))
+        except (sqlite3.Error, OSError) as e:
+            self._failed('read', e)
+            return None
+        if row is None:
+            if count:
+                self.misses += 1
+            return None
+        if count:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        if self.disabled:
+            return
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO verdicts (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now, now),
+            )
+            with self._lock:
+                self._puts += 1
+                evict = self._puts % _EVICT_EVERY == 0
+            if evict:
+                self._evict(conn, now)
+        except (sqlite3.Error, OSError) as e:
+            self._failed('write', e)
+
+    def _evict(self, conn, now):
+        # Other processes write too, so work from what is in the table
+        removed = conn.execute('DELETE FROM verdicts WHERE created <= ?', (now - self.ttl,)).rowcount
+        count = conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+        if count > self.max_entries:
+            removed += conn.execute(
+                'DELETE FROM verdicts WHERE key IN '
+                '(SELECT key FROM verdicts ORDER BY accessed LIMIT ?)',
+                (count - int(self.max_entries * _EVICT_TO),),
+            ).rowcount
+        self.evictions += max(removed, 0)
+
+    def get_or_compute(self, kind, parts, compute):
+        """
+        Return the verdict of kind for parts, calling compute() and storing it
+        on a miss. Identical misses in flight at the same time, in any worker,
+        share one computation.
+        """
+        key = verdict_key(kind, *parts)
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def build():
+            value = compute()
+            self.put(key, value)
+            return value
+
+        return SINGLE_FLIGHT.do(('verdict', key), build, lookup=lambda: self.get(key, count=False))
+
+    def stats(self):
+        entries = None
+        if not self.disabled:
+            try:
+                entries = self._connection().execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+            except (sqlite3.Error, OSError) as e:
+                self._failed('read', e)
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path or None,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'errors': self.errors,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+VERDICT_STORE = VerdictStore()